@@ -1,64 +1,414 @@
 import os
+import shutil
 import subprocess
 import math
 
+from media_cache import temp_name
+from media_probe import probe, probe_duration, scan_packets
+from progress import run_ffmpeg
+
+# Andaze ke upar itni jagah aur (muxer overhead, bitrate ka utaar chadhaao)
+SPACE_MARGIN = 1.05
+SPACE_RESERVE_BYTES = 256 * 1024 * 1024
+
+# Tail ki video dobara encode karne ke liye (input ka codec -> encoder)
+TAIL_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
+
 def get_video_duration(input_file):
-    """Video ki total duration seconds mein nikalne ke liye."""
-    cmd = f'ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 "{input_file}"'
-    result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-    try:
-        return float(result.stdout.strip())
-    except:
+    """Video ki total duration seconds mein nikalne ke liye (ffprobe, result cache hota hai)."""
+    return probe_duration(input_file)
+
+def cut_tail_segment(input_file, tail_seconds, tail_file):
+    """
+    Video ke shuru se sirf tail_seconds ka hissa kaatna (last copy ke liye).
+    Stream copy se -t B-frames ki wajah se cut ke baad wale packets bhi rakh leta hai (25fps par
+    2 frames zyada), is liye video ke theek round(tail_seconds * fps) frames dobara encode hote hain.
+    Audio copy hota hai: timestamps jaise hain waise rehne dena, tail ka layout (audio priming samet)
+    baqi copies jaisa ho to seam par gap nahi aata.
+    """
+    info = probe(input_file)
+    video = info and info["video"]
+    encoder = video and TAIL_ENCODERS.get(video["codec"])
+    if encoder and video["fps"]:
+        frames = max(1, round(tail_seconds * video["fps"]))
+        pix_fmt = f'-pix_fmt {video["pix_fmt"]} ' if video["pix_fmt"] else ""
+        # B-frames sirf tab jab input mein hon: warna tail ka DTS delay baqi copies se alag hota hai
+        # aur concat seam par video DTS daba deta hai (ek frame ka overlap)
+        b_frames = "-bf 0 " if video["has_b_frames"] == 0 else ""
+        # dump_extra: SPS/PPS har keyframe ke saath, taake concat (jo pehli file ke headers rakhta hai)
+        # ke baad bhi tail apne encoder settings ke saath decode ho
+        command = (f'ffmpeg -v error -i "{input_file}" -t {tail_seconds:.3f} -frames:v {frames} '
+                   f'-c:v {encoder} -crf 18 {pix_fmt}{b_frames}-bsf:v dump_extra=freq=keyframe '
+                   f'-c:a copy "{tail_file}" -y')
+    else:
+        # Anjaan codec: stream copy (cut ke baad ek do frame aa sakte hain)
+        command = f'ffmpeg -v error -i "{input_file}" -t {tail_seconds:.3f} -c copy "{tail_file}" -y'
+    result = subprocess.run(command, shell=True)
+    return result.returncode == 0 and os.path.exists(tail_file)
+
+def stream_loop_is_seamless(input_file, tolerance=0.001):
+    """
+    -stream_loop har copy ko poori file ki span (sab streams ka earliest start se latest end tak)
+    aage khiskata hai. Agar koi stream chhoti ho - jaise AAC priming ki wajah se audio -23ms se
+    shuru ho - to doosri stream mein har seam par gap aata hai aur player atakta hai.
+    """
+    report = scan_packets(input_file)
+    if not report:
+        return False
+    spans = [(s["start"], s["end"]) for s in report["streams"].values() if s["start"] is not None]
+    total = max(end for _, end in spans) - min(start for start, _ in spans)
+    return all(abs((end - start) - total) <= tolerance for start, end in spans)
+
+def resolve_strategy(input_file, strategy, has_tail=False):
+    """
+    Jo strategy asal mein chalegi: stream_loop sirf tab jab wo seamless aur exact ho sake, warna
+    doubling (har copy concat se judti hai magar list mein sirf log2(copies) entries aati hain).
+    Returns (strategy, wajah) - wajah None agar strategy nahi badli.
+    """
+    if strategy != "stream_loop":
+        return strategy, None
+    if has_tail:
+        # Stream copy mein -t frame-exact nahi katta; doubling tail ko alag se theek frames par kaat leti hai
+        return "doubling", "Exact tail ke liye"
+    if not stream_loop_is_seamless(input_file):
+        # Concat demuxer har copy ko video ke hisaab se jorta hai, is liye seams par gap nahi aata
+        return "doubling", "Input ki streams ki lambai barabar nahi (audio priming)"
+    return strategy, None
+
+def write_concat_list(list_file, paths, durations=None):
+    """
+    Concat demuxer ki list file likhna (absolute paths, forward slashes).
+    durations: har entry ki asli lambai - concat phir file ki duration (jo priming ki wajah se
+    thori lambi hoti hai) ki jagah yehi use karta hai, warna har seam par gap ban jata hai.
+    """
+    with open(list_file, "w") as f:
+        for i, path in enumerate(paths):
+            abs_path = os.path.abspath(path).replace('\\', '/')
+            f.write(f"file '{abs_path}'\n")
+            if durations and durations[i]:
+                f.write(f"duration {durations[i]:.6f}\n")
+
+def concat_copy(list_file, paths, output_file, durations=None, read_args=""):
+    write_concat_list(list_file, paths, durations)
+    command = f'ffmpeg -v error {read_args}-f concat -safe 0 -i "{list_file}" -c copy "{output_file}" -y'
+    return subprocess.run(command, shell=True).returncode == 0
+
+def build_doubled_parts(input_file, copy_count, copy_seconds, work_dir, read_args=""):
+    """
+    copy_count ko binary mein tod kar 1x, 2x, 4x, 8x... parts banana (har part pichle ko
+    stream copy se double karta hai). Final list mein sirf log2(copy_count) entries aati hain.
+    Returns (parts, durations).
+    """
+    ext = os.path.splitext(input_file)[1]
+    # Concat ka output timestamps ko khiska deta hai (audio 0 par, video priming jitna aage);
+    # 1x part bhi concat se guzaar kar sab parts ka layout ek jaisa rakhna
+    base = os.path.join(work_dir, f"x1{ext}")
+    if not concat_copy(os.path.join(work_dir, "x1.txt"), [input_file], base, read_args=read_args):
+        raise RuntimeError("1x part nahi ban saka.")
+    parts = []
+    durations = []
+    power = base
+    multiple = 1
+    while copy_count:
+        if copy_count & 1:
+            parts.append(power)
+            durations.append(multiple * copy_seconds)
+        copy_count >>= 1
+        if copy_count:
+            doubled = os.path.join(work_dir, f"x{multiple * 2}{ext}")
+            pair_list = os.path.join(work_dir, f"x{multiple * 2}.txt")
+            if not concat_copy(pair_list, [power, power], doubled, [multiple * copy_seconds] * 2, read_args):
+                raise RuntimeError(f"{multiple * 2}x part nahi ban saka.")
+            multiple *= 2
+            power = doubled
+    return parts, durations
+
+def existing_parent(path):
+    """Folder abhi na bana ho to uska sab se qareebi mojood parent (disk usage wahi batata hai)."""
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+def plan_disk_usage(input_file, target_seconds, output_file, strategy="list", output_format="mp4", work_dir="."):
+    """
+    Likhne se pehle andaza: output kitne bytes ka hoga (source ka bitrate x target duration)
+    aur jahan likhna hai wahan kitni jagah khali hai. Probe na ho sake to None.
+      output_bytes - final file (HLS mein sirf ek copy aur tail ke segments)
+      temp_bytes   - doubling ke 1x/2x/4x... parts, jo final write tak work_dir mein rehte hain
+      free_bytes   - output wale filesystem par khali jagah
+      needed_bytes - usi filesystem par kitni chahiye (margin samet)
+      ok           - har filesystem par zaroori jagah mojood hai
+    """
+    info = probe(input_file)
+    if not info or not info["duration"]:
+        return None
+    copy_bytes = os.path.getsize(input_file)
+    copy_count = max(1, math.ceil(target_seconds / info["duration"]))
+
+    if output_format == "hls":
+        # Ek copy ke segments + tail ke segments (tail ek copy se chhota hota hai)
+        output_bytes = copy_bytes * 2
+        temp_bytes = 0
+    else:
+        output_bytes = int(copy_bytes / info["duration"] * target_seconds)
+        # 1x + 2x + ... + sab se bara part = (2 * sab se bara - 1) copies
+        temp_bytes = (2 * (1 << (copy_count.bit_length() - 1)) - 1) * copy_bytes if strategy == "doubling" else 0
+
+    # Output aur work_dir ek hi disk par hon to dono ki zaroorat jor kar check karna
+    output_dir = existing_parent(os.path.dirname(os.path.abspath(output_file)))
+    needs = {}
+    for path, size in ((output_dir, output_bytes), (existing_parent(os.path.abspath(work_dir)), temp_bytes)):
+        if size:
+            device = os.stat(path).st_dev
+            first_path, total = needs.get(device, (path, 0))
+            needs[device] = (first_path, total + size)
+    free = {device: shutil.disk_usage(path).free for device, (path, _) in needs.items()}
+    required = {device: int(total * SPACE_MARGIN) + SPACE_RESERVE_BYTES for device, (_, total) in needs.items()}
+
+    output_device = os.stat(output_dir).st_dev
+    return {
+        "output_bytes": output_bytes,
+        "temp_bytes": temp_bytes,
+        "free_bytes": free[output_device],
+        "needed_bytes": required[output_device],
+        "ok": all(required[device] <= free[device] for device in needs),
+    }
+
+def read_rate_args(input_file, io_limit_mb):
+    """
+    io_limit_mb (MB/s) ko ffmpeg -readrate mein badalna: readrate real-time ka multiple hai,
+    is liye limit ko input ke bytes-per-second se taqseem karte hain. Limit na ho to "".
+    """
+    info = probe(input_file)
+    if not io_limit_mb or not info or not info["duration"]:
+        return ""
+    bytes_per_second = os.path.getsize(input_file) / info["duration"]
+    return f"-readrate {io_limit_mb * 1024 * 1024 / bytes_per_second:.3f} "
+
+def segment_for_hls(input_file, out_dir, prefix, segment_seconds=6):
+    """Input ko sirf ek dafa HLS (.ts) segments mein todna. Returns [(duration, file_name), ...]"""
+    playlist = os.path.join(out_dir, f"{prefix}_src.m3u8")
+    seg_pattern = os.path.join(out_dir, f"{prefix}_%05d.ts")
+    command = (f'ffmpeg -v error -i "{input_file}" -c copy -f hls -hls_time {segment_seconds} '
+               f'-hls_playlist_type vod -hls_segment_filename "{seg_pattern}" "{playlist}" -y')
+    if subprocess.run(command, shell=True).returncode != 0 or not os.path.exists(playlist):
         return None
 
-def fast_duplicate_video_by_hours(input_file, output_file, target_hours):
+    segments = []
+    duration = None
+    with open(playlist) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line and not line.startswith("#") and duration is not None:
+                segments.append((duration, line))
+                duration = None
+    os.remove(playlist)
+    return segments
+
+def write_hls_loop_playlist(playlist_file, segments, copy_count, tail_segments=()):
+    """
+    Wohi chand segments copy_count dafa refer karne wali VOD playlist. Har repeat par
+    EXT-X-DISCONTINUITY taake player timestamps reset hone ko sahi handle kare.
+    """
+    runs = [segments] * copy_count
+    if tail_segments:
+        runs.append(tail_segments)
+    target_duration = math.ceil(max(d for run in runs for d, _ in run))
+
+    with open(playlist_file, "w") as f:
+        f.write("#EXTM3U\n#EXT-X-VERSION:3\n")
+        f.write(f"#EXT-X-TARGETDURATION:{target_duration}\n")
+        f.write("#EXT-X-MEDIA-SEQUENCE:0\n#EXT-X-PLAYLIST-TYPE:VOD\n")
+        for idx, run in enumerate(runs):
+            if idx:
+                f.write("#EXT-X-DISCONTINUITY\n")
+            for duration, uri in run:
+                f.write(f"#EXTINF:{duration:.6f},\n{uri}\n")
+        f.write("#EXT-X-ENDLIST\n")
+
+def hls_loop(input_file, output_file, copy_count, tail_seconds=0):
+    """
+    HLS output: input ke segments ek dafa likhe jate hain, playlist unhe baar baar dohrati hai.
+    10 ghante ki video = chand MB ki playlist + ek copy ke segments. Returns playlist path.
+    Sab kuch pehle ek temp folder mein banta hai; segments out_dir mein move hone ke baad hi
+    playlist asli naam par aati hai, taake adhoori playlist kabhi nazar na aaye.
+    """
+    out_dir = os.path.dirname(os.path.abspath(output_file))
+    base = os.path.splitext(os.path.basename(output_file))[0]
+    playlist_file = os.path.join(out_dir, f"{base}.m3u8")
+    stage_dir = temp_name(os.path.join(out_dir, base))
+    tail_file = os.path.join(stage_dir, f"{base}_temp_tail" + os.path.splitext(input_file)[1])
+    os.makedirs(stage_dir)
+
+    try:
+        segments = segment_for_hls(input_file, stage_dir, base)
+        if not segments:
+            print("HLS segments nahi ban sake.")
+            return None
+
+        tail_segments = []
+        if tail_seconds and cut_tail_segment(input_file, tail_seconds, tail_file):
+            tail_segments = segment_for_hls(tail_file, stage_dir, f"{base}_tail") or []
+
+        stage_playlist = os.path.join(stage_dir, f"{base}.m3u8")
+        write_hls_loop_playlist(stage_playlist, segments, copy_count, tail_segments)
+        for _, uri in segments + tail_segments:
+            os.replace(os.path.join(stage_dir, uri), os.path.join(out_dir, uri))
+        os.replace(stage_playlist, playlist_file)
+        return playlist_file
+    finally:
+        shutil.rmtree(stage_dir, ignore_errors=True)
+
+def fast_duplicate_video_by_hours(input_file, output_file, target_hours, exact=False, strategy="list",
+                                  output_format="mp4", work_dir=".", on_progress=None, io_limit_mb=None):
+    """
+    exact=True: N-1 poori copies + aakhri copy ki jagah ek chhota kata hua tail segment,
+    taake output bilkul target duration ka ho (overshoot nahi).
+    strategy:
+      "list"        - har copy ki ek line (purana tareeqa)
+      "doubling"    - 2x, 4x, 8x... parts bana kar sirf chand entries concat karna
+      "stream_loop" - ffmpeg -stream_loop, list file ki zaroorat hi nahi
+    output_format:
+      "mp4"  - aam MP4 (moov atom aakhir mein likha jata hai)
+      "fmp4" - fragmented MP4, likhte waqt hi play ho sakti hai (video copy, audio AAC mein dobara encode)
+      "hls"  - output_file ke naam ki .m3u8 playlist jo wohi segments dohrati hai (disk par duplication nahi)
+    work_dir: temp list/tail/parts yahan bante hain (har job ka alag folder taake files na takrayein)
+    on_progress: diya ho to ffmpeg -progress se asli progress (fps, speed, ETA) is callback ko milti hai
+    io_limit_mb: diya ho to input isse zyada MB/s se nahi parha jata (shared disk par doosri jobs ke liye)
+
+    Returns: kamyabi par jo strategy asal mein chali (resolve_strategy, HLS ke liye "hls"), warna False.
+
+    Output pehle "<naam>.tmp<pid>-<uuid><ext>" mein likha jata hai aur kamyabi par hi asli naam par rename
+    hota hai - beech mein disk bhar jaye ya process ruk jaye to aadhi file asli naam par nahi bachti.
+    """
     if not os.path.exists(input_file):
         print(f"Error: {input_file} nahi mili!")
-        return
+        return False
 
     # 1. Video ki duration check karna
     duration_seconds = get_video_duration(input_file)
     if not duration_seconds:
         print("Video ki duration maloom nahi ho saki. FFmpeg/FFprobe check karein.")
-        return
+        return False
 
     # 2. Calculation: Kitni copies chahiye
     target_seconds = target_hours * 3600
     copy_count = math.ceil(target_seconds / duration_seconds)
-    
-    actual_duration_hrs = (copy_count * duration_seconds) / 3600
+    tail_seconds = 0
+
+    if exact:
+        copy_count = int(target_seconds // duration_seconds)
+        tail_seconds = target_seconds - copy_count * duration_seconds
+        # Ek frame (~1/60s) se chhota tail chhor dena
+        if tail_seconds < 0.017:
+            tail_seconds = 0
+
+    actual_duration_hrs = (copy_count * duration_seconds + tail_seconds) / 3600
 
     print(f"Original Video Length: {duration_seconds:.2f} seconds")
     print(f"Target: {target_hours} hours")
     print(f"Zaroori Copies: {copy_count}")
     print(f"Final Video Duration takreeban {actual_duration_hrs:.2f} hours hogi.")
 
-    # 3. List file banana
-    list_file = "temp_list.txt"
-    with open(list_file, "w") as f:
-        abs_path = os.path.abspath(input_file).replace('\\', '/')
-        for _ in range(copy_count):
-            f.write(f"file '{abs_path}'\n")
+    if output_format != "hls":
+        strategy, reason = resolve_strategy(input_file, strategy, bool(tail_seconds))
+        if reason:
+            print(f"{reason} stream_loop ki jagah {strategy} use ho rahi hai.")
+
+    plan = plan_disk_usage(input_file, actual_duration_hrs * 3600, output_file, strategy, output_format, work_dir)
+    if plan and not plan["ok"]:
+        print(f"Disk par jagah kam hai: takreeban {plan['needed_bytes'] / 1e9:.1f} GB chahiye, "
+              f"{plan['free_bytes'] / 1e9:.1f} GB khali hai.")
+        return False
+
+    if output_format == "hls":
+        playlist_file = hls_loop(input_file, output_file, copy_count, tail_seconds)
+        if playlist_file:
+            print(f"\nKaam ho gaya! Playlist yahan hai: {playlist_file}")
+        return "hls" if playlist_file else False
 
-    # 4. FFmpeg Command
-    print("\nProcessing shuru hai... please intezar karein.")
-    command = f'ffmpeg -f concat -safe 0 -i {list_file} -c copy "{output_file}" -y'
+    # Fragmented MP4: moov shuru mein, har keyframe par naya fragment.
+    # Fragments mein edit list nahi hoti jo AAC priming chhupaye, is liye har seam par audio
+    # overlap ho jata - video copy hoti hai aur sirf audio dobara encode hota hai: aresample
+    # timestamps ko ek lagataar line mein jorta hai, aur avoid_negative_ts band hai taake muxer
+    # pehle packet ko alag se shift kar ke shuru mein gap na daale.
+    codec_args = "-c copy "
+    if output_format == "fmp4":
+        codec_args = ("-c:v copy -c:a aac -af aresample=async=1 -avoid_negative_ts disabled "
+                      "-movflags +frag_keyframe+empty_moov+default_base_moof ")
+
+    # 3. Strategy ke hisaab se FFmpeg command tayar karna
+    root, ext = os.path.splitext(output_file)
+    partial_file = temp_name(root) + ext
+    read_args = read_rate_args(input_file, io_limit_mb)
+    list_file = os.path.join(work_dir, "temp_list.txt")
+    tail_file = os.path.join(work_dir, "temp_tail" + os.path.splitext(input_file)[1])
+    parts_dir = os.path.join(work_dir, "temp_loop_parts")
 
     try:
-        result = subprocess.run(command, shell=True)
-        if result.returncode == 0:
-            print(f"\nKaam ho gaya! File yahan hai: {output_file}")
+        if strategy == "stream_loop":
+            # Koi list nahi - ffmpeg khud input ko dobara parhta hai, -t se exact cut
+            if exact:
+                command = f'ffmpeg {read_args}-stream_loop -1 -i "{input_file}" -t {target_seconds} {codec_args}"{partial_file}" -y'
+            else:
+                command = f'ffmpeg {read_args}-stream_loop {copy_count - 1} -i "{input_file}" {codec_args}"{partial_file}" -y'
         else:
-            print("FFmpeg mein koi masla aya.")
+            if strategy == "doubling":
+                os.makedirs(parts_dir, exist_ok=True)
+                parts, durations = build_doubled_parts(
+                    input_file, copy_count, duration_seconds, parts_dir, read_args)
+            else:
+                parts = [input_file] * copy_count
+                durations = None
+            if tail_seconds:
+                if not cut_tail_segment(input_file, tail_seconds, tail_file):
+                    print("Tail segment nahi ban saka.")
+                    return False
+                if strategy == "doubling":
+                    # Tail bhi 1x part ki tarah concat se guzarna, taake uska layout baqi parts jaisa ho
+                    tail_part = os.path.join(parts_dir, "tail" + os.path.splitext(tail_file)[1])
+                    if not concat_copy(os.path.join(parts_dir, "tail.txt"), [tail_file], tail_part,
+                                       read_args=read_args):
+                        print("Tail segment nahi ban saka.")
+                        return False
+                    parts.append(tail_part)
+                else:
+                    parts.append(tail_file)
+                if durations:
+                    durations.append(None)
+            write_concat_list(list_file, parts, durations)
+            command = f'ffmpeg {read_args}-f concat -safe 0 -i "{list_file}" {codec_args}"{partial_file}" -y'
+
+        # 4. FFmpeg Command
+        print(f"\nProcessing shuru hai ({strategy})... please intezar karein.")
+        if on_progress:
+            returncode, _ = run_ffmpeg(command, on_progress, total_seconds=actual_duration_hrs * 3600)
+        else:
+            returncode = subprocess.run(command, shell=True).returncode
+        if returncode == 0:
+            os.replace(partial_file, output_file)
+            print(f"\nKaam ho gaya! File yahan hai: {output_file}")
+            return strategy
+        print("FFmpeg mein koi masla aya.")
+        return False
     except Exception as e:
         print(f"Error: {e}")
+        return False
     finally:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
         if os.path.exists(list_file):
             os.remove(list_file)
+        if os.path.exists(tail_file):
+            os.remove(tail_file)
+        shutil.rmtree(parts_dir, ignore_errors=True)
 
 # --- Settings ---
 video_input = "merged.mp4"      # Aapki asli file
 video_output = "BoneFire.mp4"   # Jo file banegi
 target_hrs = 10                # Jitne ghante ki video chahiye
 
-fast_duplicate_video_by_hours(video_input, video_output, target_hrs)
\ No newline at end of file
+if __name__ == "__main__":
+    fast_duplicate_video_by_hours(video_input, video_output, target_hrs)
\ No newline at end of file
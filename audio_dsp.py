@@ -0,0 +1,218 @@
+"""
+Streaming effects chain for the Song Generator.
+
+ffmpeg decodes the vocal to float32 PCM on a pipe, the chain processes it in
+BLOCK_SECONDS blocks and a second ffmpeg encodes each block as it arrives, so
+memory stays flat no matter how long the track is. Every stage keeps its filter
+state between blocks (sosfilt/lfilter zi, delay-line history), so block edges
+are seamless without overlapping the blocks.
+
+Per style: gain -> EQ (RBJ biquads) -> compressor -> reverb (Schroeder) -> limiter.
+"""
+import time
+import subprocess
+
+import numpy as np
+from scipy import signal
+
+from progress import REPORT_INTERVAL
+
+SAMPLE_RATE = 44100
+BLOCK_SECONDS = 1.0
+TAIL_SECONDS = 0.5
+
+# eq: (type, frequency Hz, gain dB, Q); compressor: threshold dB, ratio, attack/release seconds
+STYLE_PRESETS = {
+    "Funk": {"gain_db": 3, "eq": [("lowshelf", 120, 3, 0.7), ("peaking", 2500, 2, 1.0)],
+             "compressor": {"threshold_db": -18, "ratio": 4, "attack": 0.005, "release": 0.08},
+             "reverb": {"mix": 0.10, "room": 0.3}},
+    "Pop": {"gain_db": 2, "eq": [("peaking", 3000, 2, 1.0), ("highshelf", 10000, 2, 0.7)],
+            "compressor": {"threshold_db": -20, "ratio": 3, "attack": 0.01, "release": 0.1},
+            "reverb": {"mix": 0.18, "room": 0.5}},
+    "Rock": {"gain_db": 4, "eq": [("lowshelf", 100, 2, 0.7), ("peaking", 1500, 3, 0.9)],
+             "compressor": {"threshold_db": -16, "ratio": 5, "attack": 0.003, "release": 0.06},
+             "reverb": {"mix": 0.12, "room": 0.4}},
+    "Jazz": {"gain_db": 1, "eq": [("lowshelf", 200, 2, 0.7), ("highshelf", 8000, -2, 0.7)],
+             "compressor": {"threshold_db": -24, "ratio": 2, "attack": 0.02, "release": 0.2},
+             "reverb": {"mix": 0.22, "room": 0.6}},
+    "Ambient": {"gain_db": -1, "eq": [("highshelf", 6000, -3, 0.7)],
+                "compressor": {"threshold_db": -26, "ratio": 2, "attack": 0.03, "release": 0.3},
+                "reverb": {"mix": 0.40, "room": 0.9}},
+    "Chill": {"gain_db": 0, "eq": [("lowshelf", 150, 1, 0.7), ("highshelf", 9000, -1, 0.7)],
+              "compressor": {"threshold_db": -22, "ratio": 2.5, "attack": 0.02, "release": 0.25},
+              "reverb": {"mix": 0.25, "room": 0.7}},
+}
+
+
+def _biquad(kind, freq, gain_db, q, sample_rate):
+    """One second-order section (RBJ audio EQ cookbook) as an sos row."""
+    a_gain = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * freq / sample_rate
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / (2 * q)
+    if kind == "peaking":
+        b = [1 + alpha * a_gain, -2 * cos_w0, 1 - alpha * a_gain]
+        a = [1 + alpha / a_gain, -2 * cos_w0, 1 - alpha / a_gain]
+    else:
+        shelf = 2 * np.sqrt(a_gain) * alpha
+        sign = 1 if kind == "lowshelf" else -1
+        b = [a_gain * ((a_gain + 1) - sign * (a_gain - 1) * cos_w0 + shelf),
+             sign * 2 * a_gain * ((a_gain - 1) - sign * (a_gain + 1) * cos_w0),
+             a_gain * ((a_gain + 1) - sign * (a_gain - 1) * cos_w0 - shelf)]
+        a = [(a_gain + 1) + sign * (a_gain - 1) * cos_w0 + shelf,
+             -sign * 2 * ((a_gain - 1) + sign * (a_gain + 1) * cos_w0),
+             (a_gain + 1) + sign * (a_gain - 1) * cos_w0 - shelf]
+    return np.concatenate([b, a]) / a[0]
+
+
+class Equalizer:
+    """Cascade of biquads run with sosfilt, state carried between blocks."""
+
+    def __init__(self, bands, sample_rate):
+        self.sos = np.array([_biquad(kind, f, g, q, sample_rate) for kind, f, g, q in bands])
+        self.zi = np.zeros((len(self.sos), 2))
+
+    def process(self, x):
+        y, self.zi = signal.sosfilt(self.sos, x, zi=self.zi)
+        return y
+
+
+class Compressor:
+    """Feed-forward RMS compressor; level detector and gain smoother are one-pole lfilters."""
+
+    def __init__(self, sample_rate, threshold_db, ratio, attack, release):
+        self.threshold_db = threshold_db
+        self.slope = 1 - 1 / ratio
+        detect = np.exp(-1 / (attack * sample_rate))
+        smooth = np.exp(-1 / (release * sample_rate))
+        self.detector = ([1 - detect], [1, -detect])
+        self.smoother = ([1 - smooth], [1, -smooth])
+        self.detector_zi = np.zeros(1)
+        self.smoother_zi = np.zeros(1)
+        # Make up roughly half of the reduction a signal at 0 dBFS would get
+        self.makeup_db = -threshold_db * self.slope / 2
+
+    def process(self, x):
+        power, self.detector_zi = signal.lfilter(*self.detector, x * x, zi=self.detector_zi)
+        level_db = 10 * np.log10(power + 1e-12)
+        reduction_db = -np.maximum(level_db - self.threshold_db, 0) * self.slope
+        gain_db, self.smoother_zi = signal.lfilter(*self.smoother, reduction_db, zi=self.smoother_zi)
+        return x * 10 ** ((gain_db + self.makeup_db) / 20)
+
+
+class _DelayLine:
+    """
+    y[n] = direct * x[n] + x[n-d] + feedback * y[n-d]  (comb: direct=0, allpass: direct=-feedback).
+    Processed in chunks of at most d samples, so each chunk only needs the carried history.
+    """
+
+    def __init__(self, delay, feedback, direct=0.0):
+        self.delay = delay
+        self.feedback = feedback
+        self.direct = direct
+        self.x_hist = np.zeros(delay)
+        self.y_hist = np.zeros(delay)
+
+    def process(self, x):
+        out = np.empty_like(x)
+        for start in range(0, len(x), self.delay):
+            chunk = x[start:start + self.delay]
+            n = len(chunk)
+            y = self.direct * chunk + self.x_hist[:n] + self.feedback * self.y_hist[:n]
+            out[start:start + n] = y
+            self.x_hist = np.concatenate([self.x_hist[n:], chunk])
+            self.y_hist = np.concatenate([self.y_hist[n:], y])
+        return out
+
+
+class Reverb:
+    """Schroeder reverb: 4 parallel combs into 2 series allpasses (Freeverb tunings)."""
+    COMB_DELAYS = (1116, 1188, 1277, 1356)
+    ALLPASS_DELAYS = (556, 441)
+
+    def __init__(self, sample_rate, mix, room):
+        scale = sample_rate / 44100
+        feedback = 0.7 + 0.28 * room
+        self.combs = [_DelayLine(int(d * scale), feedback) for d in self.COMB_DELAYS]
+        self.allpasses = [_DelayLine(int(d * scale), 0.5, direct=-0.5) for d in self.ALLPASS_DELAYS]
+        self.mix = mix
+
+    def process(self, x):
+        wet = sum(comb.process(x) for comb in self.combs) / len(self.combs)
+        for allpass in self.allpasses:
+            wet = allpass.process(wet)
+        return (1 - self.mix) * x + self.mix * wet
+
+
+class EffectsChain:
+    """All stages of one style preset; process() takes and returns one float block."""
+
+    def __init__(self, style, sample_rate=SAMPLE_RATE):
+        preset = STYLE_PRESETS.get(style, STYLE_PRESETS["Chill"])
+        self.gain = 10 ** (preset["gain_db"] / 20)
+        self.stages = [Equalizer(preset["eq"], sample_rate),
+                       Compressor(sample_rate, **preset["compressor"]),
+                       Reverb(sample_rate, **preset["reverb"])]
+
+    def process(self, x):
+        x = x.astype(np.float64) * self.gain
+        for stage in self.stages:
+            x = stage.process(x)
+        return np.clip(x, -1.0, 1.0).astype(np.float32)
+
+
+def process_file(src, dst, style, sample_rate=SAMPLE_RATE, total_seconds=None, on_progress=None):
+    """
+    Decode src, run it through the style's chain block by block (plus TAIL_SECONDS of silence
+    so the reverb can ring out) and encode to dst. on_progress gets run_ffmpeg-style stats.
+    Returns the encoder's stderr on failure, None on success.
+    """
+    decoder = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-i", src, "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "pipe:1"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    encoder = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-y", "-f", "f32le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0", dst],
+        stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    chain = EffectsChain(style, sample_rate)
+    block_bytes = int(sample_rate * BLOCK_SECONDS) * 4
+    started = time.time()
+    last_report = 0.0
+    samples = 0
+    try:
+        while True:
+            data = decoder.stdout.read(block_bytes)
+            if not data:
+                break
+            block = np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+            encoder.stdin.write(chain.process(block).tobytes())
+            samples += len(block)
+
+            now = time.time()
+            if on_progress and now - last_report >= REPORT_INTERVAL:
+                last_report = now
+                position = samples / sample_rate
+                elapsed = now - started
+                speed = position / elapsed if elapsed > 0 else 0.0
+                on_progress({"position": round(position, 2), "fps": None, "speed": round(speed, 1), "bytes": None,
+                             "elapsed": round(elapsed, 2),
+                             "fraction": min(1.0, position / total_seconds) if total_seconds else None,
+                             "eta": round((total_seconds - position) / speed, 1)
+                             if total_seconds and speed > 0 else None})
+
+        encoder.stdin.write(chain.process(np.zeros(int(sample_rate * TAIL_SECONDS), dtype=np.float32)).tobytes())
+        encoder.stdin.close()
+        stderr = encoder.stderr.read().decode(errors="replace")
+        encoder.wait()
+        decoder.wait()
+    except BaseException:
+        for proc in (decoder, encoder):
+            proc.kill()
+            proc.wait()
+        raise
+
+    if decoder.returncode != 0 or samples == 0:
+        return "Could not decode the vocal track."
+    if encoder.returncode != 0:
+        return stderr.strip() or "Encoding failed."
+    return None
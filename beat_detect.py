@@ -0,0 +1,189 @@
+"""
+Beat grid for BeatMerge: onset envelope + tempo estimate, streamed from ffmpeg.
+
+The audio is decoded by ffmpeg straight to mono float32 at SAMPLE_RATE and read
+in BLOCK_SECONDS blocks, so a one-hour track never sits in memory as full PCM.
+Each block becomes STFT frames in one vectorized rfft; spectral flux of the
+log magnitudes is the onset envelope. Tempo comes from the envelope's
+autocorrelation, the beat phase from the best comb alignment.
+
+The grid is cached per audio digest, so re-running a track skips the decode.
+"""
+import json
+import subprocess
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft, signal
+
+from media_cache import DiskCache, make_key, quick_digest
+
+SAMPLE_RATE = 11025
+N_FFT = 1024
+HOP = 256
+BLOCK_SECONDS = 60
+MIN_BPM = 60
+MAX_BPM = 200
+BEAT_CACHE_BYTES = 16 * 1024 * 1024
+
+
+def _pcm_blocks(audio_path, sample_rate=SAMPLE_RATE, block_seconds=BLOCK_SECONDS):
+    """Yield mono float32 blocks of the decoded audio."""
+    # A short resampling filter is plenty for onsets and keeps the decode close to real mp3 speed
+    cmd = ["ffmpeg", "-v", "error", "-i", audio_path, "-vn", "-ac", "1",
+           "-af", f"aresample={sample_rate}:filter_size=8", "-f", "f32le", "pipe:1"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    block_bytes = int(sample_rate * block_seconds) * 4
+    try:
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+
+def onset_envelope(audio_path):
+    """Spectral-flux onset strength per STFT frame. Returns (envelope, frames_per_second)."""
+    window = np.hanning(N_FFT).astype(np.float32)
+    # The first frame is centered on t=0, the tail of each block carries over to the next
+    carry = np.zeros(N_FFT // 2, dtype=np.float32)
+    prev_mag = None
+    chunks = []
+    for block in _pcm_blocks(audio_path):
+        buf = np.concatenate([carry, block])
+        n_frames = (len(buf) - N_FFT) // HOP + 1
+        if n_frames <= 0:
+            carry = buf
+            continue
+        frames = sliding_window_view(buf, N_FFT)[::HOP][:n_frames]
+        mag = np.log1p(100 * np.abs(fft.rfft(frames * window, axis=1, workers=-1)))
+        if prev_mag is None:
+            prev_mag = mag[:1]
+        chunks.append(np.maximum(np.diff(mag, axis=0, prepend=prev_mag), 0).sum(axis=1))
+        prev_mag = mag[-1:]
+        carry = buf[n_frames * HOP:]
+
+    frame_rate = SAMPLE_RATE / HOP
+    if not chunks:
+        return np.zeros(0, dtype=np.float32), frame_rate
+    env = np.concatenate(chunks)
+    # Remove the slow loudness trend (about 1s) so only the attacks remain
+    trend = np.convolve(env, np.ones(int(frame_rate)) / int(frame_rate), mode="same")
+    return np.maximum(env - trend, 0), frame_rate
+
+
+def estimate_period(env, frame_rate, min_bpm=MIN_BPM, max_bpm=MAX_BPM):
+    """Beat period in envelope frames (fractional) from the autocorrelation peak, or None."""
+    min_lag = int(frame_rate * 60 / max_bpm)
+    max_lag = int(np.ceil(frame_rate * 60 / min_bpm))
+    if len(env) < 2 * max_lag:
+        return None
+    centered = env - env.mean()
+    ac = signal.correlate(centered, centered, mode="full", method="fft")[len(env) - 1:]
+    # Compare the peaks at their parabola-refined lag and height, on a smoothed copy: a beat period
+    # between two lags splits its sharp peak over both, and the peak at twice the period (closer to
+    # a whole lag) would win at half tempo
+    smoothed = np.convolve(ac, np.hanning(7)[1:-1], mode="same")
+    lags = np.arange(min_lag, max_lag + 1)
+    is_peak = (smoothed[lags] > 0) & (smoothed[lags] >= smoothed[lags - 1]) & (smoothed[lags] >= smoothed[lags + 1])
+    lags = lags[is_peak]
+    if not len(lags):
+        return None
+    shifts = np.array([_peak_shift(smoothed, lag) for lag in lags])
+    heights = smoothed[lags] - 0.25 * (smoothed[lags - 1] - smoothed[lags + 1]) * shifts
+    # Prefer tempos near 120 BPM so half/double tempo peaks don't win
+    bpm = 60 * frame_rate / (lags + shifts)
+    score = heights * np.exp(-0.5 * np.log2(bpm / 120) ** 2)
+    best = int(np.argmax(score))
+    period = lags[best] + shifts[best]
+
+    # Refine on the peaks at 4, 16, 64... beats: a small error per beat would add up over an hour
+    multiple = 4
+    while multiple * period < len(env) / 2:
+        center = int(round(multiple * period))
+        lo, hi = center - 3, center + 4
+        peak = lo + int(np.argmax(ac[lo:hi]))
+        period = (peak + _peak_shift(ac, peak)) / multiple
+        multiple *= 4
+    return period
+
+
+def _peak_shift(values, idx):
+    """Sub-sample position of a peak from a parabola through its neighbours."""
+    if not 0 < idx < len(values) - 1:
+        return 0.0
+    y0, y1, y2 = values[idx - 1:idx + 2]
+    denom = y0 - 2 * y1 + y2
+    return 0.5 * (y0 - y2) / denom if denom else 0.0
+
+
+def beat_phase(env, period):
+    """Offset (in frames) of the first beat: the comb of period spacing that collects the most onset energy."""
+    n_beats = max(1, int((len(env) - 1) // period))
+    candidates = np.arange(int(np.ceil(period)))
+    idx = np.rint(candidates[:, None] + np.arange(n_beats)[None, :] * period).astype(np.int64)
+    scores = env[np.minimum(idx, len(env) - 1)].sum(axis=1)
+    return int(candidates[np.argmax(scores)])
+
+
+def detect_beats(audio_path):
+    """
+    Beat grid of an audio file, or None if no steady beat was found:
+        {"tempo": bpm, "period": seconds, "offset": first beat in seconds,
+         "duration": seconds, "beats": [seconds, ...]}
+    """
+    cache = DiskCache("beats", BEAT_CACHE_BYTES)
+    key = make_key("beats", quick_digest(audio_path), SAMPLE_RATE, N_FFT, HOP, MIN_BPM, MAX_BPM)
+    cached = cache.get(key, ".json")
+    if cached:
+        with open(cached) as f:
+            return json.load(f)
+
+    env, frame_rate = onset_envelope(audio_path)
+    period = estimate_period(env, frame_rate)
+    if period is None:
+        return None
+    offset = beat_phase(env, period)
+    duration = len(env) / frame_rate
+    period_s = period / frame_rate
+    offset_s = offset / frame_rate
+    grid = {
+        "tempo": round(float(60 / period_s), 2),
+        "period": float(period_s),
+        "offset": float(offset_s),
+        "duration": round(duration, 3),
+        "beats": np.round(np.arange(offset_s, duration, period_s), 4).tolist(),
+    }
+
+    tmp_path = cache.temp_path(key, ".json")
+    with open(tmp_path, "w") as f:
+        json.dump(grid, f)
+    cache.put(key, tmp_path, ".json")
+    return grid
+
+
+def beat_cut_frames(durations, period, fps):
+    """
+    Frame count for each clip so every cut lands on a whole beat: each clip keeps as many
+    whole beats as it has (at least one). Cut positions are rounded on the running total,
+    so frame rounding never accumulates into drift across the template.
+    """
+    frames = []
+    beats = 0
+    previous_end = 0
+    for duration in durations:
+        beats += max(1, int(duration // period))
+        end = round(beats * period * fps)
+        frames.append(end - previous_end)
+        previous_end = end
+    return frames
+
+
+def video_offset(grid):
+    """Seconds to skip into the (beat-cut) template so its cuts line up with the track's beats."""
+    return (grid["period"] - grid["offset"]) % grid["period"]
@@ -0,0 +1,163 @@
+"""
+Headless batch BeatMerge: many audio tracks x one clip pack in a single run.
+
+The visual template is rendered once (or taken from the template cache), then
+every track is muxed against it in parallel (video stream copy + AAC).
+
+    python beatmerge_cli.py --clips clip --audio songs/ --out-dir out
+    python beatmerge_cli.py --clips clip --audio tracks.txt --jobs 8 --profile draft --report report.csv
+
+--audio is a folder of audio files or a manifest: a .txt file with one path per
+line, or a .json list of paths / {"audio": ..., "output": ...} objects.
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_render import RENDER_PROFILES, DEFAULT_PROFILE, OUTPUT_PROFILES, DEFAULT_OUTPUT
+from progress import ProgressReporter
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".aac", ".flac", ".ogg")
+ENGINES = {"moviepy": "MoviePy", "ffmpeg": "FFmpeg (single pass)", "parallel": "FFmpeg (parallel clips)"}
+
+
+def load_tracks(audio_arg, out_dir):
+    """[(audio_path, output_path), ...] from a folder or a manifest file."""
+    def default_output(path):
+        return os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + ".mp4")
+
+    if os.path.isdir(audio_arg):
+        files = sorted(f for f in os.listdir(audio_arg) if f.lower().endswith(AUDIO_EXTENSIONS))
+        return [(os.path.join(audio_arg, f), default_output(f)) for f in files]
+
+    base = os.path.dirname(os.path.abspath(audio_arg))
+    tracks = []
+    if audio_arg.lower().endswith(".json"):
+        with open(audio_arg) as f:
+            for entry in json.load(f):
+                if isinstance(entry, str):
+                    entry = {"audio": entry}
+                audio = os.path.join(base, entry["audio"])
+                output = os.path.join(out_dir, entry["output"]) if entry.get("output") else default_output(audio)
+                tracks.append((audio, output))
+    else:
+        with open(audio_arg) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    audio = os.path.join(base, line)
+                    tracks.append((audio, default_output(audio)))
+    return tracks
+
+
+def mux_track(template_path, audio_path, output_path):
+    """Mux one track and return its report row."""
+    from pipelines import mux_beatmerge_audio
+
+    start = time.perf_counter()
+    error = None
+    if not os.path.exists(audio_path):
+        error = "audio file not found"
+    else:
+        error = mux_beatmerge_audio(template_path, audio_path, output_path)
+    return {
+        "audio": audio_path,
+        "output": output_path,
+        "status": "failed" if error else "done",
+        "seconds": round(time.perf_counter() - start, 3),
+        "output_bytes": os.path.getsize(output_path) if not error else 0,
+        "error": error or "",
+    }
+
+
+def write_report(path, summary):
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["audio", "output", "status", "seconds", "output_bytes", "error"])
+            writer.writeheader()
+            writer.writerows(summary["tracks"])
+    else:
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", required=True, help="folder containing the video clips")
+    parser.add_argument("--audio", required=True, help="folder of audio files or a .txt/.json manifest")
+    parser.add_argument("--out-dir", default="batch_output")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="parallel mux jobs")
+    parser.add_argument("--engine", choices=list(ENGINES), default="parallel")
+    parser.add_argument("--profile", choices=list(RENDER_PROFILES), default=DEFAULT_PROFILE)
+    parser.add_argument("--format", choices=list(OUTPUT_PROFILES), default=DEFAULT_OUTPUT, help="output canvas")
+    parser.add_argument("--render-workers", type=int, default=None, help="clip workers for the parallel engine")
+    parser.add_argument("--badge-text", default="Subscribe!")
+    parser.add_argument("--text-color", default="#FFFFFF")
+    parser.add_argument("--box-color", default="#3F3075")
+    parser.add_argument("--font-size", type=int, default=24)
+    parser.add_argument("--no-badge", action="store_true")
+    parser.add_argument("--no-side-cover", action="store_true")
+    parser.add_argument("--report", default=None, help="summary report (.json or .csv), default <out-dir>/report.json")
+    args = parser.parse_args(argv)
+
+    from pipelines import render_beatmerge_template
+
+    if not os.path.isdir(args.clips):
+        parser.error(f"clip folder '{args.clips}' does not exist")
+    os.makedirs(args.out_dir, exist_ok=True)
+    tracks = load_tracks(args.audio, args.out_dir)
+    if not tracks:
+        parser.error(f"no audio tracks found in '{args.audio}'")
+
+    params = dict(
+        folder_path=os.path.abspath(args.clips), enable_badge=not args.no_badge,
+        side_cover=not args.no_side_cover, render_engine=ENGINES[args.engine],
+        render_workers=args.render_workers, render_profile=args.profile, output_profiles=[args.format],
+        badge=dict(text=args.badge_text, text_color=args.text_color, box_color=args.box_color,
+                   font_size=args.font_size),
+    )
+
+    # 1. Render the visual template once for every track
+    started = time.perf_counter()
+    progress = ProgressReporter(lambda percent, message, metrics: print(f"[{percent:3d}%] {message}", flush=True))
+    with tempfile.TemporaryDirectory(prefix="beatmerge_batch_") as work_dir:
+        template_path = render_beatmerge_template(params, work_dir, progress)
+    template_seconds = round(time.perf_counter() - started, 3)
+    print(f"Template ready in {template_seconds:.1f}s: {template_path}")
+
+    # 2. Fan out the per-track mux jobs
+    print(f"Muxing {len(tracks)} tracks with {args.jobs} parallel jobs...")
+    rows = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(mux_track, template_path, audio, output) for audio, output in tracks]
+        for done, future in enumerate(futures, start=1):
+            row = future.result()
+            rows.append(row)
+            mark = "✓" if row["status"] == "done" else "✗"
+            print(f"  {mark} [{done}/{len(tracks)}] {os.path.basename(row['audio'])} "
+                  f"({row['seconds']:.1f}s){' - ' + row['error'].splitlines()[-1] if row['error'] else ''}")
+
+    summary = {
+        "clips": params["folder_path"],
+        "engine": params["render_engine"],
+        "render_profile": args.profile,
+        "template_seconds": template_seconds,
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "tracks_done": sum(r["status"] == "done" for r in rows),
+        "tracks_failed": sum(r["status"] == "failed" for r in rows),
+        "tracks": rows,
+    }
+    report_path = args.report or os.path.join(args.out_dir, "report.json")
+    write_report(report_path, summary)
+    print(f"Done: {summary['tracks_done']} ok, {summary['tracks_failed']} failed in "
+          f"{summary['total_seconds']:.1f}s. Report: {report_path}")
+    return 1 if summary["tracks_failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
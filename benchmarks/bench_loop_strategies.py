@@ -0,0 +1,93 @@
+"""
+Compare the Hours Looper concat strategies (list / doubling / stream_loop).
+
+Generates short synthetic clips with ffmpeg's lavfi sources, loops them to each
+target duration with every strategy and prints wall time, output size and whether
+the seams validate (media_probe.scan_packets). Two sources are looped: one without
+B-frames like a draft/ultrafast BeatMerge output, and one with x264's default B-frames.
+
+    python benchmarks/bench_loop_strategies.py
+    python benchmarks/bench_loop_strategies.py --targets 1 10 24 --clip-seconds 5 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Hrslooping import fast_duplicate_video_by_hours  # noqa: E402
+from media_probe import scan_packets  # noqa: E402
+
+STRATEGIES = ["list", "doubling", "stream_loop"]
+# x264 preset per source: ultrafast writes no B-frames, veryfast uses them
+SOURCES = {"no-bframes": "ultrafast", "bframes": "veryfast"}
+
+
+def make_clip(path, seconds, size="320x240", fps=25, preset="ultrafast"):
+    """Small test pattern + sine tone clip, similar in structure to a BeatMerge output."""
+    cmd = ["ffmpeg", "-v", "error", "-y",
+           "-f", "lavfi", "-i", f"testsrc=size={size}:rate={fps}:duration={seconds}",
+           "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+           "-c:v", "libx264", "-preset", preset, "-g", str(fps), "-c:a", "aac", "-shortest", path]
+    subprocess.run(cmd, check=True)
+
+
+def run(targets, clip_seconds, exact, sources=tuple(SOURCES)):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="loopbench_") as work:
+        clips = {}
+        for source in sources:
+            clips[source] = os.path.join(work, f"clip_{source}.mp4")
+            make_clip(clips[source], clip_seconds, preset=SOURCES[source])
+        cwd = os.getcwd()
+        os.chdir(work)  # the looper writes its temp list/parts next to the cwd
+        try:
+            for source, clip in clips.items():
+                for hours in targets:
+                    for strategy in STRATEGIES:
+                        out = os.path.join(work, f"out_{strategy}_{hours}h.mp4")
+                        start = time.perf_counter()
+                        ran = fast_duplicate_video_by_hours(clip, out, hours, exact=exact, strategy=strategy)
+                        elapsed = time.perf_counter() - start
+                        size = os.path.getsize(out) if os.path.exists(out) else 0
+                        # Not timed: every packet's timestamps must continue across the loop seams
+                        report = scan_packets(out) if ran else None
+                        # stream_loop falls back to doubling for AAC priming or an exact tail; record what ran
+                        results.append({"source": source, "target_hours": hours, "strategy": strategy,
+                                        "ran": ran or None, "ok": bool(ran), "seconds": round(elapsed, 3),
+                                        "output_bytes": size, "seams_ok": report["ok"] if report else None})
+                        if os.path.exists(out):
+                            os.remove(out)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", type=float, nargs="+", default=[1, 10, 24], help="target hours")
+    parser.add_argument("--clip-seconds", type=float, default=5)
+    parser.add_argument("--no-exact", action="store_true", help="overshoot to whole copies like the old looper")
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), default=list(SOURCES))
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.targets, args.clip_seconds, exact=not args.no_exact, sources=args.sources)
+
+    print(f"\n{'source':>11} {'target':>8} {'strategy':>12} {'ran':>12} {'seconds':>10} {'output MB':>10} {'seams':>6}")
+    for r in results:
+        status = "" if r["ok"] else "  FAILED"
+        seams = {True: "ok", False: "GAPS", None: "-"}[r["seams_ok"]]
+        print(f"{r['source']:>11} {r['target_hours']:>7}h {r['strategy']:>12} {r['ran'] or '-':>12} "
+              f"{r['seconds']:>10.2f} {r['output_bytes'] / 1024 ** 2:>10.1f} {seams:>6}{status}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+End-to-end benchmark of the three tools (BeatMerge, Hours Looper, Song Generator).
+
+All inputs are synthetic and generated with ffmpeg's lavfi sources (test
+patterns at mixed resolutions/fps, a click track, sine "vocal" fragments), so
+the suite runs offline on any Linux box with ffmpeg. Each scenario runs the
+real pipeline headlessly in its own process with empty caches and records per
+stage: wall time, CPU time (including ffmpeg children), peak RSS and bytes on
+disk. Results are compared against a stored baseline JSON; a stage that got
+slower than --tolerance fails the run. Timings only compare on the same machine,
+so no baseline ships with the repo: store one with --update-baseline first (a
+run without a baseline fails).
+
+    python benchmarks/bench_pipelines.py
+    python benchmarks/bench_pipelines.py --scenarios beatmerge-ffmpeg song --clips 8
+    python benchmarks/bench_pipelines.py --update-baseline
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from progress import ProgressReporter  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# (lavfi source, size, fps) cycled over the generated clips
+CLIP_SOURCES = [("testsrc", "1920x1080", 30), ("testsrc2", "1280x720", 25),
+                ("smptebars", "720x1280", 30), ("mandelbrot", "640x480", 24)]
+LYRICS = ["Hello, this is my song", "Singing on the beat", "Hello, this is my song", "One more line to end"]
+SONG_VOICE = "en-US-AriaNeural"
+
+SCENARIOS = {
+    "beatmerge-ffmpeg": ("beatmerge", {"render_engine": "FFmpeg (single pass)"}),
+    "beatmerge-parallel": ("beatmerge", {"render_engine": "FFmpeg (parallel clips)"}),
+    "beatmerge-beat-sync": ("beatmerge", {"render_engine": "FFmpeg (parallel clips)", "beat_sync": True}),
+    "beatmerge-moviepy": ("beatmerge", {"render_engine": "MoviePy"}),
+    "hours-loop-mp4": ("hours_loop", {"strategy": "stream_loop", "output_format": "mp4"}),
+    "hours-loop-hls": ("hours_loop", {"strategy": "stream_loop", "output_format": "hls"}),
+    "song": ("song", {}),
+}
+DEFAULT_SCENARIOS = [name for name in SCENARIOS if name != "beatmerge-moviepy"]
+
+
+# --- Fixtures ---
+def _ffmpeg(*args):
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *args], check=True)
+
+
+def make_fixtures(fixture_dir, clips, clip_seconds, audio_seconds):
+    clip_dir = os.path.join(fixture_dir, "clips")
+    os.makedirs(clip_dir, exist_ok=True)
+    for idx in range(clips):
+        source, size, fps = CLIP_SOURCES[idx % len(CLIP_SOURCES)]
+        _ffmpeg("-f", "lavfi", "-i", f"{source}=size={size}:rate={fps}:duration={clip_seconds}",
+                "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+                os.path.join(clip_dir, f"clip_{idx:02d}.mp4"))
+
+    # 120 BPM click over a quiet pad, so the beat detector has something to find
+    audio = os.path.join(fixture_dir, "track.mp3")
+    _ffmpeg("-f", "lavfi", "-i",
+            f"aevalsrc='0.6*sin(2*PI*880*t)*lt(mod(t,0.5),0.04)+0.1*sin(2*PI*110*t)':s=44100:d={audio_seconds}",
+            "-c:a", "libmp3lame", audio)
+
+    loop_input = os.path.join(fixture_dir, "loop_input.mp4")
+    _ffmpeg("-f", "lavfi", "-i", "testsrc=size=1280x720:rate=30:duration=10",
+            "-f", "lavfi", "-i", "sine=frequency=440:duration=10",
+            "-c:v", "libx264", "-preset", "ultrafast", "-g", "60", "-c:a", "aac", "-shortest", loop_input)
+    return {"clips": clip_dir, "audio": audio, "loop_input": loop_input}
+
+
+def seed_tts_cache(fixture_dir, rate):
+    """Put synthetic fragments for LYRICS into the TTS cache, so the song pipeline needs no network."""
+    from media_cache import tts_cache, tts_key
+    cache = tts_cache()
+    for idx, line in enumerate(sorted(set(LYRICS))):
+        fragment = os.path.join(fixture_dir, f"fragment_{idx}.mp3")
+        _ffmpeg("-f", "lavfi", "-i", f"sine=frequency={220 + 110 * idx}:duration=3",
+                "-ac", "1", "-ar", "24000", "-c:a", "libmp3lame", fragment)
+        cache.put(tts_key("edge-tts", line, SONG_VOICE, rate), fragment, ".mp3")
+
+
+# --- Measurement ---
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _reset_peak_rss():
+    """Reset this process's high-water mark (Linux); silently keeps the lifetime peak elsewhere."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class BenchReporter(ProgressReporter):
+    """ProgressReporter that adds CPU time, peak RSS and disk usage to every stage record."""
+
+    def __init__(self, watch_dirs):
+        super().__init__()
+        self.watch_dirs = watch_dirs
+
+    @contextmanager
+    def stage(self, name):
+        _reset_peak_rss()
+        cpu_start = _cpu_seconds()
+        child_peak_start = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        with super().stage(name) as record:
+            yield record
+        # ru_maxrss of the children is their all-time maximum, so only count it if this stage raised it
+        child_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        record["cpu_seconds"] = round(_cpu_seconds() - cpu_start, 3)
+        record["peak_rss_mb"] = round(max(_peak_rss_kb(), child_peak if child_peak > child_peak_start else 0) / 1024, 1)
+        record["disk_bytes"] = sum(_dir_bytes(d) for d in self.watch_dirs)
+
+
+def run_scenario(name, fixtures, work_dir, loop_hours):
+    """Run one scenario in this process (called in a fresh subprocess) and return its result."""
+    from pipelines import PIPELINES, TEMPO_SETTINGS
+
+    kind, overrides = SCENARIOS[name]
+    if kind == "beatmerge":
+        params = dict(folder_path=fixtures["clips"], audio_path=fixtures["audio"],
+                      enable_badge=True, side_cover=True,
+                      badge=dict(text="Subscribe!", text_color="#FFFFFF", box_color="#3F3075", font_size=24),
+                      render_engine="FFmpeg (single pass)", render_workers=None, render_profile="balanced")
+    elif kind == "hours_loop":
+        params = dict(input=fixtures["loop_input"], output="looped.mp4", target_hours=loop_hours, exact=True,
+                      strategy="stream_loop", output_format="mp4")
+    else:
+        from tts import EDGE_TTS_AVAILABLE
+        if not EDGE_TTS_AVAILABLE:
+            return {"scenario": name, "ok": False, "skipped": True, "error": "edge-tts is not installed"}
+        seed_tts_cache(work_dir, TEMPO_SETTINGS["Normal"][1])
+        params = dict(lyrics="\n".join(LYRICS), song_style="Pop", voice_name=SONG_VOICE, tempo="Normal")
+    params.update(overrides)
+
+    job_dir = os.path.join(work_dir, "job")
+    os.makedirs(job_dir, exist_ok=True)
+    progress = BenchReporter([job_dir, os.environ["BEATMERGE_CACHE_DIR"]])
+    cpu_start = _cpu_seconds()
+    started = time.perf_counter()
+    result = {"scenario": name, "ok": True, "error": None}
+    try:
+        output = PIPELINES[kind](params, job_dir, progress)["output"]
+        result["output_bytes"] = _dir_bytes(os.path.dirname(output)) if output.endswith(".m3u8") \
+            else os.path.getsize(output)
+    except Exception as e:
+        result.update(ok=False, error=str(e))
+    result.update(
+        wall_seconds=round(time.perf_counter() - started, 3),
+        cpu_seconds=round(_cpu_seconds() - cpu_start, 3),
+        peak_rss_mb=round(max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024, 1),
+        stages=progress.timings,
+    )
+    return result
+
+
+def run_isolated(name, fixtures, work_root, loop_hours):
+    """Run a scenario in a fresh interpreter with its own empty caches and job folder."""
+    work_dir = os.path.join(work_root, name)
+    os.makedirs(work_dir, exist_ok=True)
+    env = dict(os.environ, BEATMERGE_CACHE_DIR=os.path.join(work_dir, "cache"),
+               BEATMERGE_JOBS_DIR=os.path.join(work_dir, "jobs"))
+    cmd = [sys.executable, os.path.abspath(__file__), "--run-scenario", name,
+           "--fixtures-json", json.dumps(fixtures), "--work-dir", work_dir, "--loop-hours", str(loop_hours)]
+    out = subprocess.run(cmd, cwd=work_dir, env=env, capture_output=True, text=True)
+    lines = out.stdout.strip().splitlines()
+    if out.returncode != 0 or not lines:
+        return {"scenario": name, "ok": False, "error": out.stderr.strip()[-2000:] or "no result"}
+    return json.loads(lines[-1])
+
+
+# --- Baseline comparison ---
+def compare(results, baseline, tolerance, min_seconds=0.1):
+    """Rows of (scenario, stage, baseline s, current s, change) and the list of regressions."""
+    rows, regressions = [], []
+    for r in results:
+        before = baseline.get(r["scenario"])
+        if not r.get("ok") or not before or not before.get("ok"):
+            continue
+        current = {"total": r["wall_seconds"], **{s["stage"]: s["seconds"] for s in r["stages"]}}
+        previous = {"total": before["wall_seconds"], **{s["stage"]: s["seconds"] for s in before["stages"]}}
+        for stage, seconds in current.items():
+            if stage not in previous:
+                continue
+            change = (seconds - previous[stage]) / previous[stage] if previous[stage] else 0.0
+            rows.append((r["scenario"], stage, previous[stage], seconds, change))
+            # Tiny stages are too noisy to gate on
+            if change > tolerance and seconds - previous[stage] > min_seconds:
+                regressions.append(f"{r['scenario']}/{stage}: {previous[stage]:.2f}s -> {seconds:.2f}s "
+                                   f"(+{change:.0%})")
+    return rows, regressions
+
+
+def print_results(results):
+    print(f"\n{'scenario':>22} {'stage':>10} {'wall s':>8} {'cpu s':>8} {'peak MB':>8} {'disk MB':>8}")
+    for r in results:
+        if not r.get("ok"):
+            status = "SKIPPED" if r.get("skipped") else "FAILED"
+            print(f"{r['scenario']:>22} {status}: {(r.get('error') or '').splitlines()[-1] if r.get('error') else ''}")
+            continue
+        for s in r["stages"]:
+            print(f"{r['scenario']:>22} {s['stage']:>10} {s['seconds']:>8.2f} {s.get('cpu_seconds', 0):>8.2f} "
+                  f"{s.get('peak_rss_mb', 0):>8.1f} {s.get('disk_bytes', 0) / 1024 ** 2:>8.1f}")
+        print(f"{r['scenario']:>22} {'total':>10} {r['wall_seconds']:>8.2f} {r['cpu_seconds']:>8.2f} "
+              f"{r['peak_rss_mb']:>8.1f} {r['output_bytes'] / 1024 ** 2:>8.1f}  (output MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=DEFAULT_SCENARIOS)
+    parser.add_argument("--clips", type=int, default=4, help="number of synthetic clips")
+    parser.add_argument("--clip-seconds", type=float, default=4)
+    parser.add_argument("--audio-seconds", type=float, default=60)
+    parser.add_argument("--loop-hours", type=float, default=0.1, help="Hours Looper target")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown per stage (0.25 = 25%%)")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    # Internal: run a single scenario in this process
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--fixtures-json", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        result = run_scenario(args.run_scenario, json.loads(args.fixtures_json), args.work_dir, args.loop_hours)
+        print(json.dumps(result))
+        return
+    if not args.update_baseline and not os.path.exists(args.baseline):
+        parser.error(f"no baseline at {args.baseline}; run with --update-baseline to store one")
+
+    with tempfile.TemporaryDirectory(prefix="pipelinebench_") as work:
+        print(f"Generating fixtures ({args.clips} clips, {args.audio_seconds:.0f}s track)...")
+        fixtures = make_fixtures(os.path.join(work, "fixtures"), args.clips, args.clip_seconds, args.audio_seconds)
+        results = []
+        for name in args.scenarios:
+            print(f"Running {name}...", flush=True)
+            results.append(run_isolated(name, fixtures, work, args.loop_hours))
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update({r["scenario"]: r for r in results if r.get("ok")})
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline updated: {args.baseline}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows, regressions = compare(results, baseline, args.tolerance)
+    print(f"\n{'scenario':>22} {'stage':>10} {'baseline s':>11} {'now s':>8} {'change':>8}")
+    for scenario, stage, before, now, change in rows:
+        print(f"{scenario:>22} {stage:>10} {before:>11.2f} {now:>8.2f} {change:>+8.0%}")
+    failed = [r["scenario"] for r in results if not r.get("ok") and not r.get("skipped")]
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    for name in failed:
+        print(f"FAILED: {name}")
+    sys.exit(1 if regressions or failed else 0)
+
+
+if __name__ == "__main__":
+    main()
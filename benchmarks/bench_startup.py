@@ -0,0 +1,120 @@
+"""
+Cold-start cost of the dashboard: module import times and the first app render.
+
+Every import is timed in a fresh interpreter (nothing already in sys.modules),
+and the first render runs app.py through Streamlit's AppTest once per tool.
+Budgets turn it into a regression gate: the exit code is 1 if any is exceeded.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --max-import-ms 500 --max-render-ms 3000 --json startup.json
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What the Streamlit script imports at the top, plus what a worker imports for its first job
+MODULES = ["streamlit", "media_cache", "media_probe", "ffmpeg_render", "job_queue", "pipelines", "Hrslooping"]
+TOOLS = ["🎵 BeatMerge (Fast)", "♾️ Hours Looper", "🎸 Song Generator"]
+
+IMPORT_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1000)
+"""
+
+RENDER_SNIPPET = """
+import sys, time, json
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+first = (time.perf_counter() - start) * 1000
+tools = {}
+for tool in json.loads(sys.argv[1]):
+    t0 = time.perf_counter()
+    at.sidebar.radio[0].set_value(tool).run()
+    tools[tool] = (time.perf_counter() - t0) * 1000
+print(json.dumps({"first_render_ms": first, "tools_ms": tools, "exceptions": [str(e.value) for e in at.exception]}))
+"""
+
+
+def _env(work_dir):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    # Keep the benchmark's job database and caches out of the real ones
+    env.setdefault("BEATMERGE_JOBS_DIR", os.path.join(work_dir, "jobs"))
+    env.setdefault("BEATMERGE_CACHE_DIR", os.path.join(work_dir, "cache"))
+    env["BEATMERGE_WORKERS"] = "0"
+    return env
+
+
+def time_import(module, env, repeat):
+    """Best of `repeat` cold imports, in milliseconds."""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+                             cwd=ROOT, env=env, capture_output=True, text=True)
+        if out.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{out.stderr}")
+        runs.append(float(out.stdout.strip().splitlines()[-1]))
+    return round(min(runs), 1)
+
+
+def time_render(env):
+    out = subprocess.run([sys.executable, "-c", RENDER_SNIPPET, json.dumps(TOOLS)],
+                         cwd=ROOT, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"AppTest run failed:\n{out.stderr}")
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["first_render_ms"] = round(result["first_render_ms"], 1)
+    result["tools_ms"] = {k: round(v, 1) for k, v in result["tools_ms"].items()}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="cold imports per module (best is kept)")
+    parser.add_argument("--max-import-ms", type=float, help="budget for the slowest project module import")
+    parser.add_argument("--max-render-ms", type=float, help="budget for the first app render")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="startupbench_") as work:
+        env = _env(work)
+        imports = {m: time_import(m, env, args.repeat) for m in MODULES}
+        render = time_render(env)
+
+    print(f"\n{'module':>16} {'import ms':>10}")
+    for module, ms in imports.items():
+        print(f"{module:>16} {ms:>10.1f}")
+    print(f"\nfirst render: {render['first_render_ms']:.0f} ms")
+    for tool, ms in render["tools_ms"].items():
+        print(f"  switch to {tool}: {ms:.0f} ms")
+    for error in render["exceptions"]:
+        print(f"  app exception: {error}")
+
+    failures = []
+    own_modules = {m: ms for m, ms in imports.items() if m != "streamlit"}
+    if args.max_import_ms and max(own_modules.values()) > args.max_import_ms:
+        slowest = max(own_modules, key=own_modules.get)
+        failures.append(f"import {slowest} took {own_modules[slowest]:.0f} ms > {args.max_import_ms:.0f} ms")
+    if args.max_render_ms and render["first_render_ms"] > args.max_render_ms:
+        failures.append(f"first render took {render['first_render_ms']:.0f} ms > {args.max_render_ms:.0f} ms")
+    if render["exceptions"]:
+        failures.append("the app raised during the render")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"imports_ms": imports, **render, "failures": failures}, f, indent=2)
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
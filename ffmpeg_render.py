@@ -0,0 +1,400 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from media_cache import segment_key
+from overlays import (badge_asset, sparkle_asset, BADGE_FADE_SECONDS, BADGE_MARGIN, BADGE_POSITION,
+                      SPARKLE_ON_SECONDS, SPARKLE_PERIOD_SECONDS)
+from progress import run_ffmpeg, stderr_tail
+
+# Default template canvas (same size as the MoviePy CompositeVideoClip in app.py)
+CANVAS_WIDTH = 1280
+CANVAS_HEIGHT = 720
+TEMPLATE_FPS = 30
+
+# Output variants: name -> canvas (width, height). Several can be rendered from one decode.
+OUTPUT_PROFILES = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "9:16": (1080, 1920),
+}
+DEFAULT_OUTPUT = "720p"
+
+
+def canvas_scale(width, height):
+    """Size of a canvas relative to the default one (by its short side); badge and blur sizes follow it."""
+    return min(width, height) / CANVAS_HEIGHT
+
+
+def _fit_filter(width, height):
+    """
+    Fit a clip to the canvas's long axis: landscape canvases fit the height (and crop extra width),
+    portrait ones fit the width (and crop extra height), so the clip is never squeezed into a strip.
+    """
+    if height > width:
+        return f"scale={width}:-2,crop={width}:'min(ih,{height})'"
+    return f"scale=-2:{height},crop='min(iw,{width})':{height}"
+
+
+def _clip_filter(idx, side_cover, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, fps=TEMPLATE_FPS, frames=None,
+                 src=None, out=None):
+    """
+    Filter chain for one input clip: fit to the canvas, optionally over a blurred side-cover.
+    frames: exact output length in frames (beat-synced cuts); short clips hold their last frame.
+    src/out: pad labels (default [idx:v] -> [v<idx>]); internal labels are derived from out.
+    """
+    src = src or f"[{idx}:v]"
+    out = out or f"[v{idx}]"
+    tag = out[1:-1]
+    if frames:
+        out = f",tpad=stop_mode=clone:stop={int(frames)},trim=end_frame={int(frames)}{out}"
+    if side_cover:
+        # Background covers the whole canvas, blurred and darkened (MultiplyColor(0.6)),
+        # foreground is fitted to the canvas and centered on top.
+        blur = max(1, round(12 * canvas_scale(width, height)))
+        return (
+            f"{src}split=2[bg_{tag}][fg_{tag}];"
+            f"[bg_{tag}]scale={width}:{height}:force_original_aspect_ratio=increase,"
+            f"crop={width}:{height},boxblur={blur}:2,"
+            f"colorchannelmixer=rr=0.6:gg=0.6:bb=0.6[bgb_{tag}];"
+            f"[fg_{tag}]{_fit_filter(width, height)}[fgs_{tag}];"
+            f"[bgb_{tag}][fgs_{tag}]overlay=(W-w)/2:(H-h)/2,"
+            f"fps={fps},setsar=1,format=yuv420p{out}"
+        )
+    return (
+        f"{src}{_fit_filter(width, height)},"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,"
+        f"fps={fps},setsar=1,format=yuv420p{out}"
+    )
+
+
+def overlay_inputs(badge, sparkle, canvases):
+    """
+    Pre-rendered overlay assets (see overlays.py) to pass as extra ffmpeg inputs after the clips,
+    in the order _overlay_chains() reads them: for each canvas, the sparkle then the badge.
+    """
+    paths = []
+    for width, height in canvases:
+        if sparkle:
+            paths.append(sparkle_asset(width, height))
+        if badge:
+            paths.append(badge_asset(badge, canvas_scale(width, height)))
+    return paths
+
+
+def _overlay_chains(src, out, tag, first_input, badge=None, sparkle=False, fade_in=True, fps=TEMPLATE_FPS):
+    """
+    Put the assets (ffmpeg inputs from first_input on) over src: the blinking sparkle, then the badge
+    at the top right with a 0.5s fade-in like CrossFadeIn(0.5). Each asset is a single PNG frame and
+    overlay repeats an input's last frame, so the static badge is converted once, not per frame.
+    """
+    chains = []
+    current = src
+    idx = first_input
+    if sparkle:
+        # Counted in frames: float seconds in mod() would drop or add a frame at some cycles
+        blink = (f"lt(mod(n,{round(SPARKLE_PERIOD_SECONDS * fps)}),"
+                 f"{round(SPARKLE_ON_SECONDS * fps)})")
+        target = f"[sp_{tag}]" if badge else out
+        chains.append(f"{current}[{idx}:v]overlay=eof_action=repeat:enable='{blink}'{target}")
+        current = target
+        idx += 1
+    if badge:
+        asset = f"[{idx}:v]format=rgba"
+        if fade_in:
+            # The same frame for half a second with rising alpha; its last (opaque) frame then repeats
+            asset += (f",loop=loop={round(BADGE_FADE_SECONDS * fps)}:size=1,setpts=N/{fps}/TB,"
+                      f"fade=t=in:d={BADGE_FADE_SECONDS}:alpha=1")
+        # Same placement as overlays.badge_position: anchored to the right edge on narrow canvases
+        x, y = BADGE_POSITION
+        left = f"'min(main_w*{x},main_w-overlay_w-min(main_w,main_h)*{BADGE_MARGIN})'"
+        chains.append(f"{asset}[b_{tag}]")
+        chains.append(f"{current}[b_{tag}]overlay=x={left}:y=main_h*{y}:eof_action=repeat{out}")
+    if not chains:
+        chains.append(f"{src}null{out}")
+    return chains
+
+
+def _as_outputs(outputs):
+    """{output_file: (width, height)}; a plain path means one output on the default canvas."""
+    if isinstance(outputs, str):
+        return {outputs: (CANVAS_WIDTH, CANVAS_HEIGHT)}
+    return dict(outputs)
+
+
+# --- Encoder tuning profiles ---
+# keyint_seconds is a target; the real GOP is adjusted so it divides the template's frame count
+RENDER_PROFILES = {
+    "draft": {"preset": "ultrafast", "crf": 28, "tune": "fastdecode", "threads": 0, "keyint_seconds": 2},
+    "balanced": {"preset": "veryfast", "crf": 23, "tune": None, "threads": 0, "keyint_seconds": 2},
+    "archive": {"preset": "slow", "crf": 18, "tune": "film", "threads": 0, "keyint_seconds": 4},
+}
+DEFAULT_PROFILE = "balanced"
+
+
+def loop_friendly_gop(total_frames, target_gop):
+    """
+    GOP length closest to target_gop that divides total_frames, so keyframes stay evenly spaced
+    across the seams when the template is looped with stream copy.
+    """
+    if not total_frames:
+        return target_gop
+    candidates = [d for d in range(max(1, target_gop // 2), target_gop * 2 + 1) if total_frames % d == 0]
+    if not candidates:
+        return target_gop
+    return min(candidates, key=lambda d: abs(d - target_gop))
+
+
+def _x264_tuning(profile, fps, total_frames):
+    gop = loop_friendly_gop(total_frames, int(profile["keyint_seconds"] * fps))
+    # Fixed, closed GOPs: every loop of the template starts on a clean keyframe, and forced
+    # keyframes (beat cuts) are IDR frames too, so stream-copy seeks and seams never need earlier frames
+    args = ["-crf", str(profile["crf"]), "-g", str(gop), "-keyint_min", str(gop),
+            "-sc_threshold", "0", "-x264-params", "open-gop=0", "-forced-idr", "1"]
+    if profile["tune"]:
+        args += ["-tune", profile["tune"]]
+    return args
+
+
+def encoder_args(profile_name=DEFAULT_PROFILE, fps=TEMPLATE_FPS, total_frames=None, threads=None):
+    """libx264 arguments for a named render profile."""
+    profile = RENDER_PROFILES[profile_name]
+    threads = profile["threads"] if threads is None else threads
+    return ["-c:v", "libx264", "-preset", profile["preset"], "-threads", str(threads),
+            *_x264_tuning(profile, fps, total_frames)]
+
+
+def moviepy_write_kwargs(profile_name=DEFAULT_PROFILE, fps=TEMPLATE_FPS, total_frames=None):
+    """Same profile as keyword arguments for MoviePy's write_videofile()."""
+    profile = RENDER_PROFILES[profile_name]
+    return {"preset": profile["preset"], "threads": profile["threads"] or os.cpu_count(),
+            "ffmpeg_params": _x264_tuning(profile, fps, total_frames)}
+
+
+def build_template_graph(clip_count, side_cover=False, badge=None, clip_frames=None, canvases=None, sparkle=False):
+    """
+    Build the whole template as one filter_complex graph: clips -> concat -> sparkle/badge overlays.
+    canvases: [(width, height), ...], one output pad [out<k>] each. Every clip is decoded once
+    and split to all canvases, so extra variants only add their own scaling and encoding.
+    The overlay assets are the inputs after the clips, as listed by overlay_inputs().
+    """
+    canvases = canvases or [(CANVAS_WIDTH, CANVAS_HEIGHT)]
+    chains = []
+    for i in range(clip_count):
+        frames = clip_frames[i] if clip_frames else None
+        if len(canvases) == 1:
+            sources = [f"[{i}:v]"]
+        else:
+            sources = [f"[c{i}_{k}]" for k in range(len(canvases))]
+            chains.append(f"[{i}:v]split={len(canvases)}{''.join(sources)}")
+        for k, (width, height) in enumerate(canvases):
+            chains.append(_clip_filter(i, side_cover, width, height, frames=frames,
+                                       src=sources[k], out=f"[v{i}_{k}]"))
+    assets_per_canvas = bool(badge) + bool(sparkle)
+    for k in range(len(canvases)):
+        inputs = "".join(f"[v{i}_{k}]" for i in range(clip_count))
+        chains.append(f"{inputs}concat=n={clip_count}:v=1:a=0[cat{k}]")
+        chains += _overlay_chains(f"[cat{k}]", f"[out{k}]", k, clip_count + k * assets_per_canvas,
+                                  badge, sparkle)
+    return ";".join(chains)
+
+
+def render_template_ffmpeg(video_files, outputs, side_cover=False, badge=None, on_progress=None,
+                           total_seconds=None, profile=DEFAULT_PROFILE, clip_frames=None, sparkle=False):
+    """
+    Render the BeatMerge template with a single ffmpeg process instead of the MoviePy frame loop.
+    outputs: output file path, or {output_file: (width, height)} to render several canvases in one pass
+    badge: None or dict(text, text_color, box_color, font_size, font=optional font file)
+    on_progress/total_seconds: see progress.run_ffmpeg
+    profile: name of a RENDER_PROFILES entry
+    clip_frames: optional frame count per clip (beat_detect.beat_cut_frames); every cut gets a keyframe
+    sparkle: blink beatmerge.py's translucent white overlay
+    Returns None if every output file was created, otherwise the tail of ffmpeg's stderr.
+    """
+    if not video_files:
+        return "no video files"
+    outputs = _as_outputs(outputs)
+
+    total_frames = round(total_seconds * TEMPLATE_FPS) if total_seconds else None
+    keyframe_args = []
+    if clip_frames:
+        total_frames = sum(clip_frames)
+        total_seconds = total_frames / TEMPLATE_FPS
+        cuts, position = [], 0
+        for frames in clip_frames[:-1]:
+            position += frames
+            cuts.append(f"{position / TEMPLATE_FPS:.6f}")
+        if cuts:
+            keyframe_args = ["-force_key_frames", ",".join(cuts)]
+
+    cmd = ["ffmpeg", "-y", "-v", "error"]
+    for v in [*video_files, *overlay_inputs(badge, sparkle, outputs.values())]:
+        cmd += ["-i", v]
+    cmd += ["-filter_complex", build_template_graph(len(video_files), side_cover, badge, clip_frames,
+                                                    list(outputs.values()), sparkle)]
+    for k, output_file in enumerate(outputs):
+        cmd += ["-map", f"[out{k}]", "-an",
+                *encoder_args(profile, total_frames=total_frames), *keyframe_args,
+                "-pix_fmt", "yuv420p",
+                output_file]
+
+    returncode, stderr = run_ffmpeg(cmd, on_progress, total_seconds)
+    if returncode != 0 or not all(os.path.exists(output_file) for output_file in outputs):
+        return stderr_tail(stderr) or "no output"
+    return None
+
+
+# --- Parallel per-clip normalization ---
+# Every segment is encoded with identical settings so they can be joined with stream copy.
+SEGMENT_FORMAT_ARGS = ["-an", "-pix_fmt", "yuv420p", "-profile:v", "high", "-video_track_timescale", "15360"]
+
+
+def normalize_clip(src, outputs, side_cover=False, badge=None, fade_in=True, threads=0, profile=DEFAULT_PROFILE,
+                   frames=None, sparkle=False):
+    """
+    Normalize one clip to the template format (canvas size, fps, pixel format, side-cover,
+    badge, sparkle) as a standalone segment, optionally cut to exactly `frames` frames.
+    outputs: segment path, or {segment_path: (width, height)}; the clip is decoded once for all of them.
+    The sparkle blink starts its cycle at the clip's first frame, so the segment doesn't depend on
+    where the clip sits in the template and stays reusable from the segment cache.
+    Runs in a worker process; returns (segment paths, error or None).
+    """
+    outputs = _as_outputs(outputs)
+    chains = []
+    sources = [f"[c{k}]" for k in range(len(outputs))] if len(outputs) > 1 else ["[0:v]"]
+    if len(outputs) > 1:
+        chains.append(f"[0:v]split={len(outputs)}{''.join(sources)}")
+    cmd = ["ffmpeg", "-y", "-v", "error"]
+    for path in [src, *overlay_inputs(badge, sparkle, outputs.values())]:
+        cmd += ["-i", path]
+    assets_per_canvas = bool(badge) + bool(sparkle)
+    for k, (width, height) in enumerate(outputs.values()):
+        chains.append(_clip_filter(0, side_cover, width, height, frames=frames, src=sources[k], out=f"[n{k}]"))
+        chains += _overlay_chains(f"[n{k}]", f"[v{k}]", k, 1 + k * assets_per_canvas, badge, sparkle, fade_in)
+    cmd += ["-filter_complex", ";".join(chains)]
+    for k, dst in enumerate(outputs):
+        cmd += ["-map", f"[v{k}]", *encoder_args(profile, threads=threads), *SEGMENT_FORMAT_ARGS, dst]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0 or not all(os.path.exists(dst) for dst in outputs):
+        return list(outputs), stderr_tail(result.stderr) or "no output"
+    return list(outputs), None
+
+
+def normalize_clips_parallel(video_files, work_dir, side_cover=False, badge=None, workers=None,
+                             on_clip_done=None, cache=None, profile=DEFAULT_PROFILE, clip_frames=None,
+                             canvases=None, sparkle=False):
+    """
+    Normalize all clips concurrently with a process pool (default: one worker per core).
+    Only the first segment gets the badge fade-in, so the joined result matches the single-pass render.
+    With a segment cache, clips already normalized with the same parameters are reused and only
+    new or changed clips are encoded.
+    canvases: [(width, height), ...]; each worker decodes its clip once and writes one segment per canvas.
+    Returns the segment paths in clip order, one list per canvas.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Split encoder threads between workers so N parallel encodes don't oversubscribe the CPU
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(work_dir, exist_ok=True)
+    canvases = canvases or [(CANVAS_WIDTH, CANVAS_HEIGHT)]
+    segments = [[os.path.join(work_dir, f"segment_{idx:04d}_{width}x{height}.mp4") for idx in range(len(video_files))]
+                for width, height in canvases]
+    clip_frames = clip_frames or [None] * len(video_files)
+    # Draw the overlay assets once here instead of racing to draw them in every worker
+    overlay_inputs(badge, sparkle, canvases)
+
+    keys = {}
+    todo = {}
+    bytes_saved = 0
+    for idx, src in enumerate(video_files):
+        for k, canvas in enumerate(canvases):
+            if cache:
+                keys[idx, k] = segment_key(src, side_cover=side_cover, badge=badge, fade_in=idx == 0,
+                                           canvas=canvas, fps=TEMPLATE_FPS,
+                                           encode=SEGMENT_FORMAT_ARGS, profile=RENDER_PROFILES[profile],
+                                           **({"frames": clip_frames[idx]} if clip_frames[idx] else {}),
+                                           **({"badge_margin": BADGE_MARGIN} if badge else {}),
+                                           **({"sparkle": True} if sparkle else {}))
+                cached = cache.get(keys[idx, k], ".mp4")
+                if cached:
+                    segments[k][idx] = cached
+                    bytes_saved += os.path.getsize(cached)
+                    continue
+            todo.setdefault(idx, []).append(k)
+
+    hits = len(video_files) * len(canvases) - sum(len(ks) for ks in todo.values())
+    done = len(video_files) - len(todo)
+    if on_clip_done and done:
+        on_clip_done(done, len(video_files))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            idx: pool.submit(normalize_clip, video_files[idx], {segments[k][idx]: canvases[k] for k in ks},
+                             side_cover, badge, idx == 0, threads, profile, clip_frames[idx], sparkle)
+            for idx, ks in todo.items()
+        }
+        try:
+            for idx, future in futures.items():
+                _, error = future.result()
+                if error:
+                    raise RuntimeError(f"Normalizing {os.path.basename(video_files[idx])} failed: {error}")
+                if cache:
+                    for k in todo[idx]:
+                        segments[k][idx] = cache.put(keys[idx, k], segments[k][idx], ".mp4",
+                                                     protect=[path for run in segments for path in run])
+                done += 1
+                if on_clip_done:
+                    on_clip_done(done, len(video_files))
+        except BaseException:
+            # Cancelled job (on_clip_done raised) or a failed clip: drop the queued clips instead of
+            # letting the with-block's shutdown(wait=True) encode all of them first
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    if cache:
+        cache.record(hits=hits, misses=len(video_files) * len(canvases) - hits, bytes_saved=bytes_saved)
+    return segments
+
+
+def concat_segments(segments, output_file, list_file):
+    """
+    Join normalized segments with the concat demuxer using stream copy (no re-encode).
+    Returns None on success, otherwise the tail of ffmpeg's stderr.
+    """
+    with open(list_file, "w") as f:
+        for seg in segments:
+            seg_abs = os.path.abspath(seg).replace('\\', '/')
+            f.write(f"file '{seg_abs}'\n")
+    cmd = ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_file,
+           "-c", "copy", output_file]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if os.path.exists(list_file):
+        os.remove(list_file)
+    if result.returncode != 0 or not os.path.exists(output_file):
+        return stderr_tail(result.stderr) or "no output"
+    return None
+
+
+def render_template_parallel(video_files, outputs, side_cover=False, badge=None, workers=None,
+                             work_dir="template_segments", on_clip_done=None, cache=None,
+                             profile=DEFAULT_PROFILE, clip_frames=None, sparkle=False):
+    """
+    Render the template as parallel per-clip segments joined with stream copy.
+    outputs: output file path, or {output_file: (width, height)} for several canvases at once.
+    Returns None on success, otherwise the error of the clip or join that failed.
+    """
+    if not video_files:
+        return "no video files"
+    outputs = _as_outputs(outputs)
+    try:
+        segments = normalize_clips_parallel(video_files, work_dir, side_cover, badge, workers,
+                                            on_clip_done, cache, profile, clip_frames, list(outputs.values()),
+                                            sparkle)
+        for k, (run, output_file) in enumerate(zip(segments, outputs)):
+            error = concat_segments(run, output_file, os.path.join(work_dir, f"segments_{k}.txt"))
+            if error:
+                return f"Joining segments failed: {error}"
+        return None
+    except RuntimeError as e:
+        return str(e)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,280 @@
+"""
+SQLite-backed background job queue for the dashboard tools.
+
+Jobs are submitted from the Streamlit UI and picked up by a pool of worker
+threads, so a browser refresh or a second operator never blocks or kills a
+running job. Every job gets its own working directory under JOBS_ROOT, which
+keeps temp files and outputs of concurrent jobs apart.
+
+Run extra workers outside Streamlit with:
+    python job_queue.py --workers 4
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import argparse
+import threading
+import traceback
+
+from progress import ProgressReporter
+
+JOBS_ROOT = os.environ.get("BEATMERGE_JOBS_DIR", "jobs")
+DB_PATH = os.path.join(JOBS_ROOT, "jobs.db")
+DEFAULT_WORKERS = int(os.environ.get("BEATMERGE_WORKERS", "2"))
+
+
+class JobCancelled(Exception):
+    """Raised inside a pipeline (via its progress callback) when the job was cancelled."""
+
+
+def _connect():
+    os.makedirs(JOBS_ROOT, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress INTEGER NOT NULL DEFAULT 0,
+            message TEXT NOT NULL DEFAULT '',
+            result TEXT,
+            error TEXT,
+            work_dir TEXT NOT NULL,
+            worker TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL
+        )
+    """)
+    # Columns added after the first release of the table
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column in ("metrics", "timings"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+    return conn
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    for column in ("result", "metrics", "timings"):
+        job[column] = json.loads(job[column]) if job[column] else None
+    return job
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:12]
+
+
+def job_dir(job_id):
+    """Private working directory of a job (created on demand)."""
+    path = os.path.abspath(os.path.join(JOBS_ROOT, job_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def submit(kind, params, job_id=None):
+    """Queue a job and return its id. Upload files into job_dir(job_id) before submitting."""
+    job_id = job_id or new_job_id()
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, params, status, message, work_dir, created) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, json.dumps(params), "Waiting for a free worker...", job_dir(job_id), time.time()),
+        )
+    finally:
+        conn.close()
+    return job_id
+
+
+def list_jobs(kind=None, limit=10):
+    """Most recent jobs first, optionally only one tool's jobs."""
+    conn = _connect()
+    try:
+        if kind:
+            rows = conn.execute("SELECT * FROM jobs WHERE kind = ? ORDER BY created DESC LIMIT ?", (kind, limit))
+        else:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,))
+        return [_row_to_job(r) for r in rows.fetchall()]
+    finally:
+        conn.close()
+
+
+def cancel(job_id):
+    """
+    Cancel a queued job right away and delete its working directory (uploads included);
+    a running job stops at its next progress update and cleans up in run_job.
+    """
+    conn = _connect()
+    try:
+        conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+        row = conn.execute("SELECT work_dir FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        cancelled = conn.execute(
+            "UPDATE jobs SET status = 'cancelled', message = 'Cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id),
+        ).rowcount
+    finally:
+        conn.close()
+    if cancelled:
+        shutil.rmtree(row["work_dir"], ignore_errors=True)
+
+
+def _claim_next(worker_name):
+    """Atomically move the oldest queued job to running and return it."""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, started = ?, message = 'Starting...' WHERE id = ?",
+            (worker_name, time.time(), row["id"]),
+        )
+        conn.execute("COMMIT")
+        return _row_to_job(row)
+    except Exception:
+        # BEGIN IMMEDIATE itself can fail (database locked), and then there is nothing to roll back
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _update(job_id, **fields):
+    conn = _connect()
+    try:
+        columns = ", ".join(f"{k} = ?" for k in fields)
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+    finally:
+        conn.close()
+
+
+def _cancel_requested(job_id):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+    finally:
+        conn.close()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def recover_stale_jobs():
+    """Requeue jobs left 'running' by a worker process on this machine that no longer exists."""
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT id, worker FROM jobs WHERE status = 'running'").fetchall()
+        for row in rows:
+            try:
+                pid = int((row["worker"] or "").split(":")[0])
+            except ValueError:
+                continue
+            if not _pid_alive(pid):
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, progress = 0, "
+                    "message = 'Requeued after worker restart' WHERE id = ?",
+                    (row["id"],),
+                )
+    finally:
+        conn.close()
+
+
+def run_job(job):
+    """Execute one claimed job with its pipeline and record the outcome."""
+    from pipelines import PIPELINES
+
+    job_id = job["id"]
+
+    def on_update(percent, message, metrics):
+        if _cancel_requested(job_id):
+            raise JobCancelled()
+        fields = {"progress": percent, "message": message}
+        if metrics:
+            fields["metrics"] = json.dumps(metrics)
+        _update(job_id, **fields)
+
+    progress = ProgressReporter(on_update)
+    try:
+        result = PIPELINES[job["kind"]](job["params"], job["work_dir"], progress)
+        _update(job_id, status="done", progress=100, message="✅ Complete!",
+                result=json.dumps(result), timings=json.dumps(progress.timings), finished=time.time())
+    except Exception as e:
+        # Tools that swallow errors (e.g. the looper) still end up here once they report failure
+        if isinstance(e, JobCancelled) or _cancel_requested(job_id):
+            _update(job_id, status="cancelled", message="Cancelled", finished=time.time())
+            shutil.rmtree(job["work_dir"], ignore_errors=True)
+            return
+        traceback.print_exc()
+        _update(job_id, status="failed", message="❌ Failed", error=str(e),
+                timings=json.dumps(progress.timings), finished=time.time())
+
+
+class WorkerPool:
+    """N daemon threads that keep pulling queued jobs from the database."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, poll_interval=1.0):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        recover_stale_jobs()
+        for idx in range(self.workers):
+            name = f"{os.getpid()}:worker-{idx}"
+            t = threading.Thread(target=self._loop, args=(name,), name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, name):
+        while not self._stop.is_set():
+            job = _claim_next(name)
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            run_job(job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run BeatMerge job workers outside Streamlit.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    pool = WorkerPool(args.workers).start()
+    print(f"{args.workers} workers polling {DB_PATH}. Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
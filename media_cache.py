@@ -0,0 +1,214 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+
+# Default cache location (next to the app), can be moved with an env variable
+CACHE_ROOT = os.environ.get("BEATMERGE_CACHE_DIR", ".beatmerge_cache")
+
+# Jobs run as threads of one process, so the stats read-modify-write needs a lock
+_stats_lock = threading.Lock()
+
+
+def temp_name(path):
+    """Unique temp file name next to path; unique per thread too, not just per process."""
+    return f"{path}.tmp{os.getpid()}-{uuid.uuid4().hex}"
+
+
+def file_fingerprint(path):
+    """Identity of an input file: path + size + mtime."""
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+# (abs path, size, mtime) -> sha256, so unchanged files are only hashed once per process
+_digest_memo = {}
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file, read in chunks so large media never sits in memory."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key in _digest_memo:
+        return _digest_memo[memo_key]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    _digest_memo[memo_key] = h.hexdigest()
+    return _digest_memo[memo_key]
+
+
+def quick_digest(path, sample_bytes=1024 * 1024):
+    """
+    Cheap content digest: file size plus the first and last sample_bytes.
+    Tells media files apart without reading multi-GB outputs end to end.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.sha256(str(size).encode("utf-8"))
+    with open(path, "rb") as f:
+        h.update(f.read(sample_bytes))
+        if size > sample_bytes:
+            f.seek(max(sample_bytes, size - sample_bytes))
+            h.update(f.read(sample_bytes))
+    return h.hexdigest()
+
+
+def make_key(*parts):
+    """Stable cache key from any JSON-serializable parameters."""
+    blob = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+class DiskCache:
+    """
+    Size-bounded, content-addressed file cache with LRU eviction.
+    Entries are plain files named <key><suffix>; the file mtime is bumped on every
+    hit and the least recently used entries are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, name, max_bytes, root=CACHE_ROOT):
+        self.directory = os.path.join(root, name)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, key, suffix=""):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def temp_path(self, key, suffix=""):
+        """A private file name to write an entry to before put(); skipped by entries()."""
+        return temp_name(self.path_for(key, suffix))
+
+    def get(self, key, suffix=""):
+        """Return the cached file path (and mark it as recently used), or None on a miss."""
+        path = self.path_for(key, suffix)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return path
+
+    def put(self, key, src_path, suffix="", move=True, protect=()):
+        """
+        Store src_path under key (atomically) and evict old entries. Returns the cached path.
+        protect: paths that must survive this eviction (e.g. other entries the caller is using).
+        """
+        path = self.path_for(key, suffix)
+        tmp_path = temp_name(path)
+        if move:
+            shutil.move(src_path, tmp_path)
+        else:
+            shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict(keep={path, *protect})
+        return path
+
+    def entries(self):
+        """(path, size, mtime) for every complete entry, oldest first."""
+        items = []
+        for name in os.listdir(self.directory):
+            if ".tmp" in name:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                items.append((path, st.st_size, st.st_mtime))
+        items.sort(key=lambda item: item[2])
+        return items
+
+    def _stats_path(self):
+        return f"{self.directory}.stats.json"
+
+    def stats(self):
+        """Hit/miss counters (persisted next to the cache) plus the current entry count and size."""
+        data = {"hits": 0, "misses": 0, "bytes_saved": 0}
+        try:
+            with open(self._stats_path()) as f:
+                data.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        items = self.entries()
+        data["entries"] = len(items)
+        data["bytes"] = sum(size for _, size, _ in items)
+        return data
+
+    def record(self, hits=0, misses=0, bytes_saved=0):
+        """Add to the persisted hit/miss counters."""
+        with _stats_lock:
+            data = self.stats()
+            data["hits"] += hits
+            data["misses"] += misses
+            data["bytes_saved"] += bytes_saved
+            tmp_path = temp_name(self._stats_path())
+            with open(tmp_path, "w") as f:
+                json.dump({k: data[k] for k in ("hits", "misses", "bytes_saved")}, f)
+            os.replace(tmp_path, self._stats_path())
+
+    def evict(self, keep=()):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        items = self.entries()
+        total = sum(size for _, size, _ in items)
+        for path, size, _ in items:
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+# --- BeatMerge template cache ---
+TEMPLATE_CACHE_BYTES = int(os.environ.get("BEATMERGE_TEMPLATE_CACHE_MB", "2048")) * 1024 * 1024
+
+
+def template_key(video_files, **params):
+    """Key for a rendered template: every input clip's identity plus every effect parameter."""
+    return make_key("template", [file_fingerprint(v) for v in video_files], params)
+
+
+# --- Per-clip normalized segment cache (shared across jobs) ---
+SEGMENT_CACHE_BYTES = int(os.environ.get("BEATMERGE_SEGMENT_CACHE_MB", "4096")) * 1024 * 1024
+
+
+def segment_cache():
+    return DiskCache("segments", SEGMENT_CACHE_BYTES)
+
+
+def segment_key(src, **params):
+    """Key for one normalized clip: source content digest plus the transform parameters."""
+    return make_key("segment", file_digest(src), params)
+
+
+# --- Synthesized TTS fragments, one per (engine, text, voice, rate) ---
+TTS_CACHE_BYTES = int(os.environ.get("BEATMERGE_TTS_CACHE_MB", "512")) * 1024 * 1024
+
+
+def tts_cache():
+    return DiskCache("tts", TTS_CACHE_BYTES)
+
+
+def tts_key(engine, text, voice, rate):
+    return make_key("tts", engine, text, voice, rate)
+
+
+# --- Pre-rendered overlay assets (badge, sparkle), one per look ---
+OVERLAY_CACHE_BYTES = int(os.environ.get("BEATMERGE_OVERLAY_CACHE_MB", "64")) * 1024 * 1024
+
+
+def overlay_cache():
+    return DiskCache("overlays", OVERLAY_CACHE_BYTES)
+
+
+def overlay_key(kind, **params):
+    """Key for a pre-rendered overlay: every parameter that changes its pixels."""
+    return make_key("overlay", kind, params)
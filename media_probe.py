@@ -0,0 +1,219 @@
+"""
+Lightweight media metadata via ffprobe - nothing is decoded.
+
+probe() returns duration, container, bitrate, video codec/resolution/fps and
+audio codec/sample rate, optionally keyframe timestamps (read from packet
+flags). Results are memoized in memory and on disk per file digest, so the
+dashboard never opens a MoviePy/pydub object just to read a duration.
+"""
+import os
+import re
+import json
+import time
+import subprocess
+from fractions import Fraction
+
+from media_cache import DiskCache, make_key, quick_digest
+from progress import REPORT_INTERVAL
+
+PROBE_CACHE_BYTES = 64 * 1024 * 1024
+# Part of the cache key: bump when probe() results gain fields, so old cached entries aren't reused
+PROBE_VERSION = 2
+
+_memo = {}
+
+
+def _ffprobe_json(args, path):
+    cmd = ["ffprobe", "-v", "error", "-print_format", "json", *args, path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except OSError:
+        # ffprobe not installed / not on PATH: same as an unreadable file
+        return None
+    if result.returncode != 0:
+        return None
+    try:
+        return json.loads(result.stdout)
+    except ValueError:
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fps(rate):
+    try:
+        fps = Fraction(rate)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return round(float(fps), 3) if fps else None
+
+
+def _keyframes(path):
+    """Timestamps of the video keyframes, read from packet flags (no decoding)."""
+    data = _ffprobe_json(["-select_streams", "v:0", "-show_entries", "packet=pts_time,flags"], path)
+    if not data:
+        return []
+    return [float(p["pts_time"]) for p in data.get("packets", [])
+            if "K" in p.get("flags", "") and p.get("pts_time") not in (None, "N/A")]
+
+
+def _parse(data):
+    fmt = data.get("format", {})
+    info = {
+        "duration": _to_float(fmt.get("duration")),
+        "format": fmt.get("format_name"),
+        "size": int(fmt["size"]) if fmt.get("size") else None,
+        "bit_rate": int(fmt["bit_rate"]) if fmt.get("bit_rate") else None,
+        "video": None,
+        "audio": None,
+    }
+    for stream in data.get("streams", []):
+        kind = stream.get("codec_type")
+        if kind == "video" and info["video"] is None and not stream.get("disposition", {}).get("attached_pic"):
+            info["video"] = {
+                "codec": stream.get("codec_name"),
+                "width": stream.get("width"),
+                "height": stream.get("height"),
+                "fps": _fps(stream.get("avg_frame_rate")) or _fps(stream.get("r_frame_rate")),
+                "pix_fmt": stream.get("pix_fmt"),
+                "has_b_frames": stream.get("has_b_frames"),
+                "bit_rate": int(stream["bit_rate"]) if stream.get("bit_rate") else None,
+            }
+        elif kind == "audio" and info["audio"] is None:
+            info["audio"] = {
+                "codec": stream.get("codec_name"),
+                "sample_rate": int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+                "channels": stream.get("channels"),
+                "bit_rate": int(stream["bit_rate"]) if stream.get("bit_rate") else None,
+            }
+    if info["duration"] is None:
+        durations = [_to_float(s.get("duration")) for s in data.get("streams", [])]
+        durations = [d for d in durations if d]
+        info["duration"] = max(durations) if durations else None
+    return info
+
+
+def probe(path, keyframes=False):
+    """
+    Metadata for a media file, or None if ffprobe can't read it.
+    keyframes=True adds "keyframes": [seconds, ...] for the first video stream.
+    """
+    if not os.path.exists(path):
+        return None
+    key = make_key("probe", quick_digest(path), keyframes, PROBE_VERSION)
+    if key in _memo:
+        return _memo[key]
+
+    cache = DiskCache("probe", PROBE_CACHE_BYTES)
+    cached = cache.get(key, ".json")
+    if cached:
+        with open(cached) as f:
+            info = json.load(f)
+    else:
+        data = _ffprobe_json(["-show_format", "-show_streams"], path)
+        if not data:
+            return None
+        info = _parse(data)
+        if keyframes:
+            info["keyframes"] = _keyframes(path) if info["video"] else []
+        tmp_path = cache.temp_path(key, ".json")
+        with open(tmp_path, "w") as f:
+            json.dump(info, f)
+        cache.put(key, tmp_path, ".json")
+
+    _memo[key] = info
+    return info
+
+
+def probe_duration(path):
+    """Duration in seconds, or None."""
+    info = probe(path)
+    return info["duration"] if info else None
+
+
+def scan_packets(path, tolerance=0.001, max_issues=20, on_progress=None, total_seconds=None):
+    """
+    Validation pass over every packet timestamp, for checking loop seams in long outputs.
+    Packets are stream-copied into ffmpeg's framecrc muxer (nothing is decoded) and each
+    stream's dts must continue where the previous packet ended (within tolerance seconds).
+    Returns None if the file can't be read, else:
+        {"ok": bool, "packets": n,
+         "streams": {index: {"type", "packets", "start", "end", "gaps", "overlaps", "max_gap"}},
+         "issues": [{"stream", "type", "at", "gap"}, ...]}   (first max_issues; gap < 0 = overlap)
+    on_progress/total_seconds: run_ffmpeg-style stats while scanning.
+    """
+    if not os.path.exists(path):
+        return None
+    cmd = ["ffmpeg", "-v", "error", "-i", path, "-map", "0", "-c", "copy", "-f", "framecrc", "pipe:1"]
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+
+    streams = {}
+    issues = []
+    packets = 0
+    started = time.time()
+    last_report = 0.0
+    try:
+        for line in proc.stdout:
+            if line.startswith("#"):
+                header = re.match(r"#(tb|media_type) (\d+): (\S+)", line)
+                if header:
+                    stream = streams.setdefault(int(header[2]), {
+                        "type": None, "packets": 0, "start": None, "end": None,
+                        "gaps": 0, "overlaps": 0, "max_gap": 0.0, "_tb": None, "_next_dts": None})
+                    if header[1] == "tb":
+                        stream["_tb"] = float(Fraction(header[3]))
+                    else:
+                        stream["type"] = header[3]
+                continue
+            fields = line.split(",", 4)
+            if len(fields) < 4:
+                continue
+            index, dts, pts, duration = (int(v) for v in fields[:4])
+            stream = streams[index]
+            tb = stream["_tb"]
+            packets += 1
+            stream["packets"] += 1
+            start, end = pts * tb, (pts + duration) * tb
+            stream["start"] = start if stream["start"] is None else min(stream["start"], start)
+            stream["end"] = end if stream["end"] is None else max(stream["end"], end)
+
+            if stream["_next_dts"] is not None:
+                gap = (dts - stream["_next_dts"]) * tb
+                if abs(gap) > tolerance:
+                    stream["gaps" if gap > 0 else "overlaps"] += 1
+                    stream["max_gap"] = max(stream["max_gap"], abs(gap))
+                    if len(issues) < max_issues:
+                        issues.append({"stream": index, "type": stream["type"],
+                                       "at": round(dts * tb, 3), "gap": round(gap, 4)})
+            stream["_next_dts"] = dts + duration
+
+            now = time.time()
+            if on_progress and now - last_report >= REPORT_INTERVAL:
+                last_report = now
+                position = dts * tb
+                on_progress({"position": round(position, 2), "fps": None, "speed": None, "bytes": None,
+                             "elapsed": round(now - started, 2),
+                             "fraction": min(1.0, position / total_seconds) if total_seconds else None,
+                             "eta": None})
+        proc.wait()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    if proc.returncode != 0 or not packets:
+        return None
+
+    for stream in streams.values():
+        del stream["_tb"], stream["_next_dts"]
+        for key in ("start", "end", "max_gap"):
+            stream[key] = round(stream[key], 4) if stream[key] is not None else None
+    ok = not any(stream["gaps"] or stream["overlaps"] for stream in streams.values())
+    return {"ok": ok, "packets": packets, "streams": streams, "issues": issues}
@@ -0,0 +1,76 @@
+"""
+Badge and sparkle overlays, rendered once as alpha PNGs and cached.
+
+Instead of rasterizing the badge text on every frame (drawtext, or a MoviePy
+TextClip composited per frame), the badge is drawn once per text/colors/font/size
+and the template graph alpha-blends that small image with the overlay filter.
+The overlay input is a single frame (plus a few looped frames for the fade-in),
+and overlay repeats its last frame, so the static part costs one conversion.
+"""
+
+from media_cache import overlay_cache, overlay_key, quick_digest
+
+BADGE_BORDER = 6
+BADGE_FADE_SECONDS = 0.5
+# Relative position of the badge's top-left corner, like with_position((0.85, 0.05), relative=True)
+BADGE_POSITION = (0.85, 0.05)
+# Smallest gap between the badge and the right edge, relative to the canvas's short side
+BADGE_MARGIN = 0.02
+
+# beatmerge.py's sparkle: white at 10% opacity, on for 0.1s every 0.4s (Blink(d_on=0.1, d_off=0.3))
+SPARKLE_OPACITY = 0.1
+SPARKLE_ON_SECONDS = 0.1
+SPARKLE_PERIOD_SECONDS = 0.4
+
+
+def _cached_png(key, draw):
+    """Path of the cached PNG for key, drawing it with draw() -> PIL image on a miss."""
+    cache = overlay_cache()
+    cached = cache.get(key, ".png")
+    if cached:
+        return cached
+    tmp_path = cache.temp_path(key, ".png")
+    draw().save(tmp_path, format="PNG")
+    return cache.put(key, tmp_path, ".png")
+
+
+def badge_asset(badge, scale=1.0):
+    """
+    PNG (RGBA) of the badge text in its box: badge is dict(text, text_color, box_color, font_size,
+    font=optional font file), scale the canvas scale (ffmpeg_render.canvas_scale). Returns its path.
+    """
+    font_size = max(1, round(badge["font_size"] * scale))
+    border = max(1, round(BADGE_BORDER * scale))
+    font_file = badge.get("font")
+    key = overlay_key("badge", text=badge["text"], text_color=badge["text_color"], box_color=badge["box_color"],
+                      font_size=font_size, border=border, font=quick_digest(font_file) if font_file else None)
+
+    def draw():
+        from PIL import Image, ImageDraw, ImageFont
+        font = ImageFont.truetype(font_file, font_size) if font_file else ImageFont.load_default(font_size)
+        left, top, right, bottom = ImageDraw.Draw(Image.new("RGBA", (1, 1))).textbbox((0, 0), badge["text"], font=font)
+        image = Image.new("RGBA", (right - left + 2 * border, bottom - top + 2 * border), badge["box_color"])
+        ImageDraw.Draw(image).text((border - left, border - top), badge["text"], font=font, fill=badge["text_color"])
+        return image
+
+    return _cached_png(key, draw)
+
+
+def badge_position(width, height, badge_width):
+    """
+    Top-left pixel position of a badge_width wide badge on a width x height canvas: BADGE_POSITION,
+    moved left where the badge would run past the right edge (narrow 9:16 canvases, long texts).
+    """
+    x, y = BADGE_POSITION
+    return min(width * x, width - badge_width - min(width, height) * BADGE_MARGIN), height * y
+
+
+def sparkle_asset(width, height, opacity=SPARKLE_OPACITY):
+    """Full-canvas PNG of translucent white; the overlay filter blinks it. Returns its path."""
+    key = overlay_key("sparkle", size=(width, height), opacity=opacity)
+
+    def draw():
+        from PIL import Image
+        return Image.new("RGBA", (width, height), (255, 255, 255, round(255 * opacity)))
+
+    return _cached_png(key, draw)
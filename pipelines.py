@@ -0,0 +1,335 @@
+"""
+Headless versions of the three dashboard tools, run by the job queue workers.
+
+Every pipeline takes (params, work_dir, progress):
+  params   - plain dict of the UI inputs (stored as JSON with the job)
+  work_dir - private folder for this job's temp and output files
+  progress - progress.ProgressReporter: progress(percent, message, **metrics), progress.stage(name)
+             and progress.tracker(...); raises JobCancelled if the job was cancelled
+and returns a result dict with at least "output".
+
+Heavy libraries (MoviePy, NumPy/SciPy, TTS engines) are imported inside the tool
+or engine that needs them, so a worker only pays for what its jobs use.
+"""
+import os
+
+from Hrslooping import fast_duplicate_video_by_hours, plan_disk_usage, resolve_strategy
+from media_probe import probe_duration, scan_packets
+from ffmpeg_render import (render_template_ffmpeg, render_template_parallel, moviepy_write_kwargs, canvas_scale,
+                           RENDER_PROFILES, DEFAULT_PROFILE, TEMPLATE_FPS, OUTPUT_PROFILES, DEFAULT_OUTPUT)
+from media_cache import DiskCache, TEMPLATE_CACHE_BYTES, template_key, segment_cache
+from overlays import BADGE_MARGIN
+from progress import run_ffmpeg, stderr_tail, MoviePyProgressLogger
+
+TEMPO_SETTINGS = {"Slow": (80, "-20%"), "Normal": (100, "+0%"), "Fast": (140, "+20%")}
+
+
+# --- Tool 1: Fast BeatMerge ---
+def render_beatmerge_templates(params, work_dir, progress, beat_period=None):
+    """
+    Render (or fetch from the cache) the short visual template for every output profile in
+    params["output_profiles"] (default: DEFAULT_OUTPUT). Returns {profile name: template path}.
+    The FFmpeg engines render all missing profiles from one decode of the clips.
+    beat_period: seconds per beat; every clip is then cut to whole beats so transitions land on beats.
+    """
+    folder_path = params["folder_path"]
+    enable_badge = params["enable_badge"]
+    # Independent of the badge: the dashboard passes side_cover=False when its badge box is off
+    side_cover = params["side_cover"]
+    badge_params = params["badge"] if enable_badge else None
+    sparkle = enable_badge and params.get("sparkle", False)
+    render_engine = params["render_engine"]
+    render_profile = params.get("render_profile", DEFAULT_PROFILE)
+    output_profiles = params.get("output_profiles") or [DEFAULT_OUTPUT]
+
+    video_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path)
+                   if f.lower().endswith(('.mp4', '.mov'))]
+    if not video_files:
+        raise RuntimeError("No video files found in the folder.")
+
+    clip_frames = None
+    if beat_period:
+        from beat_detect import beat_cut_frames
+        clip_frames = beat_cut_frames([probe_duration(v) or 0 for v in video_files], beat_period, TEMPLATE_FPS)
+
+    # Same clips + same effect settings = same template, so reuse it from the cache
+    template_cache = DiskCache("templates", TEMPLATE_CACHE_BYTES)
+    cache_keys = {}
+    templates = {}
+    for name in output_profiles:
+        canvas = OUTPUT_PROFILES[name]
+        cache_keys[name] = template_key(video_files, engine=render_engine, side_cover=side_cover, badge=badge_params,
+                                        profile=RENDER_PROFILES[render_profile],
+                                        **({"clip_frames": clip_frames} if clip_frames else {}),
+                                        **({"canvas": canvas} if name != DEFAULT_OUTPUT else {}),
+                                        **({"badge_margin": BADGE_MARGIN} if badge_params else {}),
+                                        **({"sparkle": True} if sparkle else {}))
+        templates[name] = template_cache.get(cache_keys[name], ".mp4")
+    missing = [name for name in output_profiles if not templates[name]]
+    temp_templates = {name: os.path.join(work_dir, f"temp_template_{OUTPUT_PROFILES[name][0]}x{OUTPUT_PROFILES[name][1]}.mp4")
+                      for name in missing}
+    outputs = {temp_templates[name]: OUTPUT_PROFILES[name] for name in missing}
+
+    with progress.stage("template"):
+        if not missing:
+            progress(60, "⚡ Template found in cache, skipping render...")
+        elif render_engine == "MoviePy":
+            # MoviePy 2.0+ Imports
+            from moviepy import VideoFileClip, concatenate_videoclips, ImageClip, CompositeVideoClip
+            import moviepy.video.fx as vfx
+            import numpy as np
+            from PIL import Image, ImageFilter
+            from overlays import (badge_asset, badge_position, sparkle_asset, BADGE_FADE_SECONDS,
+                                  SPARKLE_ON_SECONDS, SPARKLE_PERIOD_SECONDS)
+
+            # MoviePy composites frame by frame, so every profile is a separate render
+            for n, name in enumerate(missing):
+                width, height = OUTPUT_PROFILES[name]
+                scale = canvas_scale(width, height)
+                # MoviePy 2.x has no blur effect; blur each background frame with PIL instead
+                blur = ImageFilter.GaussianBlur(10 * scale)
+                span = 55 // len(missing)
+                base = 20 + n * span
+
+                progress(base, "🎬 Processing video clips...")
+                raw_clips = []
+                for idx, v in enumerate(video_files):
+                    c = VideoFileClip(v).without_audio()
+                    if clip_frames:
+                        # Whole beats only: trim long clips, loop clips shorter than one beat
+                        cut = clip_frames[idx] / TEMPLATE_FPS
+                        c = c.subclipped(0, cut) if c.duration >= cut else c.with_effects([vfx.Loop(duration=cut)])
+
+                    # Fit the canvas's long axis: height for landscape, width for 9:16
+                    fit = vfx.Resize(width=width) if height > width else vfx.Resize(height=height)
+                    if side_cover:
+                        # Using the explicitly imported effect classes
+                        bg = (c.with_effects([vfx.Resize(max(width / c.w, height / c.h))])
+                              .image_transform(lambda frame: np.asarray(Image.fromarray(frame).filter(blur)))
+                              .with_effects([vfx.MultiplyColor(0.6)]))
+                        fg = c.with_effects([fit])
+                        c = CompositeVideoClip([bg.with_position("center"), fg.with_position("center")],
+                                               size=(width, height))
+                    else:
+                        c = c.with_effects([fit])
+                    raw_clips.append(c)
+
+                # Create the short "visual template"
+                progress(base + span // 3, "🎞️ Creating video template...")
+                template = concatenate_videoclips(raw_clips, method="compose")
+
+                # Overlays are the same cached PNGs the FFmpeg engines use, not re-rasterized text
+                layers = [template]
+                if sparkle:
+                    layers.append(ImageClip(sparkle_asset(width, height)).with_duration(template.duration)
+                                  .with_effects([vfx.Blink(duration_on=SPARKLE_ON_SECONDS,
+                                                           duration_off=SPARKLE_PERIOD_SECONDS - SPARKLE_ON_SECONDS)]))
+                if badge_params:
+                    # Badge with smooth fade-in effect
+                    badge_clip = ImageClip(badge_asset(badge_params, scale))
+                    layers.append(badge_clip.with_duration(template.duration)
+                                  .with_position(badge_position(width, height, badge_clip.w))
+                                  .with_effects([vfx.CrossFadeIn(BADGE_FADE_SECONDS)]))
+                if len(layers) > 1:
+                    template = CompositeVideoClip(layers)
+
+                # Save the short rendered template (Only rendered once = Very Fast)
+                progress(base + span // 2, f"💾 Rendering {name} template...")
+                template.write_videofile(temp_templates[name], codec="libx264", audio=False,
+                                         logger=MoviePyProgressLogger(progress.tracker(
+                                             base + span // 2, base + span, f"💾 Rendering {name} template...")),
+                                         **moviepy_write_kwargs(render_profile, template.fps,
+                                                                round(template.duration * template.fps)),
+                                         **({"fps": TEMPLATE_FPS} if clip_frames else {}))
+        elif render_engine == "FFmpeg (parallel clips)":
+            # Each clip normalized in its own worker, then joined with stream copy
+            progress(20, f"🎬 Normalizing {len(video_files)} clips in parallel...")
+            error = render_template_parallel(
+                    video_files, outputs, side_cover=side_cover, badge=badge_params,
+                    workers=params.get("render_workers"), cache=segment_cache(),
+                    work_dir=os.path.join(work_dir, "template_segments"), profile=render_profile,
+                    clip_frames=clip_frames, sparkle=sparkle,
+                    on_clip_done=lambda done, total: progress(20 + int(40 * done / total),
+                                                              f"🎬 Normalized {done}/{total} clips..."))
+            if error:
+                raise RuntimeError(f"FFmpeg template render failed: {error}")
+        else:
+            # Same clips, side-cover, resize and overlays compiled into one ffmpeg filter graph
+            progress(30, "💾 Rendering template with FFmpeg...")
+            clips_seconds = sum(probe_duration(v) or 0 for v in video_files)
+            error = render_template_ffmpeg(video_files, outputs, side_cover=side_cover, badge=badge_params,
+                                           on_progress=progress.tracker(30, 75, "💾 Rendering template with FFmpeg..."),
+                                           total_seconds=clips_seconds, profile=render_profile,
+                                           clip_frames=clip_frames, sparkle=sparkle)
+            if error:
+                raise RuntimeError(f"FFmpeg template render failed: {error}")
+
+    for name in missing:
+        templates[name] = template_cache.put(cache_keys[name], temp_templates[name], ".mp4",
+                                             protect=[path for path in templates.values() if path])
+    return templates
+
+
+def render_beatmerge_template(params, work_dir, progress, beat_period=None):
+    """The template for the first (or default) output profile. Returns its path."""
+    return next(iter(render_beatmerge_templates(params, work_dir, progress, beat_period).values()))
+
+
+def mux_beatmerge_audio(template_path, audio_path, output_final, on_progress=None, video_offset=0):
+    """
+    Loop the template under one audio track (video stream copy + AAC). Returns the tail of ffmpeg's stderr on failure.
+    video_offset: seconds to start into the template (beat phase alignment, see beat_detect.video_offset)
+    """
+    # FFmpeg Command: Loop video + Add Audio + Cut at audio end using STREAM COPY
+    # -stream_loop re-reads the template itself, so no per-copy list file is needed.
+    # With stream copy, -ss starts at the previous keyframe and the mp4 edit list hides the extra frames.
+    seek = f"-ss {video_offset:.3f} " if video_offset else ""
+    cmd = f'ffmpeg {seek}-stream_loop -1 -i "{template_path}" -i "{audio_path}" -c:v copy -c:a aac -map 0:v:0 -map 1:a:0 -shortest "{output_final}" -y'
+    returncode, stderr = run_ffmpeg(cmd, on_progress, total_seconds=probe_duration(audio_path))
+    if returncode != 0 or not os.path.exists(output_final):
+        return stderr_tail(stderr) or "Output video was not created."
+    return None
+
+
+def run_beatmerge(params, work_dir, progress):
+    grid = None
+    if params.get("beat_sync"):
+        from beat_detect import detect_beats, video_offset
+        progress(5, "🥁 Detecting beats...")
+        with progress.stage("beats"):
+            grid = detect_beats(params["audio_path"])
+        progress(15, f"🥁 {grid['tempo']:.0f} BPM" if grid else "🥁 No steady beat found, using full clips")
+
+    templates = render_beatmerge_templates(params, work_dir, progress, grid["period"] if grid else None)
+    render_profile = params.get("render_profile", DEFAULT_PROFILE)
+
+    # High-Speed FFmpeg Stream Copy (Matching the MP3), once per output profile
+    progress(75, "🔗 Merging video and audio...")
+    outputs = {}
+    for n, (name, template_path) in enumerate(templates.items()):
+        suffix = "" if len(templates) == 1 else "_" + name.replace(":", "x")
+        outputs[name] = os.path.join(work_dir, f"beatmerge_output{suffix}.mp4")
+        start = 75 + 15 * n // len(templates)
+        with progress.stage("mux" if len(templates) == 1 else f"mux {name}"):
+            error = mux_beatmerge_audio(template_path, params["audio_path"], outputs[name],
+                                        progress.tracker(start, 75 + 15 * (n + 1) // len(templates),
+                                                         f"🔗 Merging video and audio ({name})..."),
+                                        video_offset=video_offset(grid) if grid else 0)
+        if error:
+            raise RuntimeError(f"Output video was not created ({name}): {error}")
+
+    progress(90, "✅ Finalizing...")
+    result = {"output": next(iter(outputs.values())),
+              "render_profile": {"name": render_profile, **RENDER_PROFILES[render_profile]}}
+    if len(outputs) > 1:
+        result["outputs"] = outputs
+    if grid:
+        result["tempo"] = grid["tempo"]
+    return result
+
+
+# --- Tool 2: Hours Looper ---
+def run_hours_loop(params, work_dir, progress):
+    v_in = params["input"]
+    v_out = params["output"]
+    if not os.path.isabs(v_out):
+        v_out = os.path.join(work_dir, v_out)
+    if not os.path.exists(v_in):
+        raise RuntimeError(f"Input file '{v_in}' not found. Please run BeatMerge first.")
+
+    # Fail in seconds rather than after hours of writing into a full disk
+    progress(5, "💾 Checking disk space...")
+    with progress.stage("plan"):
+        # Estimate for the strategy that will really run (stream_loop may fall back to doubling's parts)
+        strategy = params["strategy"]
+        if params["output_format"] != "hls":
+            strategy, _ = resolve_strategy(v_in, strategy, params["exact"])
+        plan = plan_disk_usage(v_in, params["target_hours"] * 3600, v_out, strategy, params["output_format"], work_dir)
+    if plan and not plan["ok"]:
+        raise RuntimeError(f"Not enough disk space: about {plan['needed_bytes'] / 1e9:.1f} GB needed, "
+                           f"{plan['free_bytes'] / 1e9:.1f} GB free at the output location.")
+
+    progress(10, f"⏳ Processing {params['target_hours']} hours...")
+    with progress.stage("loop"):
+        ran = fast_duplicate_video_by_hours(v_in, v_out, params["target_hours"], exact=params["exact"],
+                                            strategy=params["strategy"], output_format=params["output_format"],
+                                            work_dir=work_dir, io_limit_mb=params.get("io_limit_mb"),
+                                            on_progress=progress.tracker(10, 90, f"⏳ Looping to {params['target_hours']} hours..."))
+    if params["output_format"] == "hls":
+        # HLS writes <name>.m3u8 plus the segments it references
+        v_out = os.path.splitext(v_out)[0] + ".m3u8"
+
+    if not os.path.exists(v_out):
+        raise RuntimeError("Processing failed. Output file was not created.")
+    result = {"output": v_out}
+    if ran and params["output_format"] != "hls":
+        result["strategy"] = ran
+    if plan:
+        result["disk_plan"] = {"estimated_bytes": plan["output_bytes"], "written_bytes": os.path.getsize(v_out)
+                               if params["output_format"] != "hls" else None}
+
+    # HLS repeats are separated by EXT-X-DISCONTINUITY on purpose, so only files are scanned
+    if params.get("validate") and params["output_format"] != "hls":
+        progress(90, "🔎 Checking packet timestamps...")
+        with progress.stage("validate"):
+            report = scan_packets(v_out, on_progress=progress.tracker(90, 99, "🔎 Checking packet timestamps..."),
+                                  total_seconds=params["target_hours"] * 3600)
+        if report:
+            result["seams"] = {"ok": report["ok"], "packets": report["packets"], "issues": report["issues"][:5],
+                               "gaps": sum(s["gaps"] + s["overlaps"] for s in report["streams"].values())}
+
+    progress(99, "✅ Finalizing...")
+    return result
+
+
+# --- Tool 3: Song Generator ---
+def run_song_generator(params, work_dir, progress):
+    from tts import synthesize_lyrics
+    from audio_dsp import process_file
+
+    lyrics = params["lyrics"]
+    song_style = params["song_style"]
+    voice_name = params["voice_name"]
+    tempo = params["tempo"]
+
+    progress(10, "🎤 Generating AI singing voice...")
+    bpm, rate = TEMPO_SETTINGS[tempo]
+    output_base = os.path.join(work_dir, "generated_song")
+
+    with progress.stage("vocal"):
+        # Generate vocal line by line; lines synthesized before come from the TTS cache
+        output_vocal, cached_lines = synthesize_lyrics(
+            lyrics, voice_name, rate, output_base, work_dir,
+            pyttsx3_rate=100 + (tempo == "Fast") * 50 - (tempo == "Slow") * 50,
+            on_fragment=lambda done, total: progress(10 + int(30 * done / total),
+                                                     f"🎤 Synthesized {done}/{total} lines..."))
+        progress(40, f"🎤 Vocal generated ({cached_lines} lines from cache)" if cached_lines
+                 else "🎤 Vocal generated")
+
+    # Probe instead of decoding the whole vocal into memory just to check it
+    vocal_seconds = probe_duration(output_vocal)
+    if not vocal_seconds:
+        raise RuntimeError("Failed to generate vocal track.")
+
+    # Style effects chain runs block by block between an ffmpeg decoder and encoder (flat memory)
+    progress(60, "🎵 Processing audio...")
+    output_song = f"{output_base}_{song_style.lower()}.mp3"
+    with progress.stage("effects"):
+        error = process_file(output_vocal, output_song, song_style, total_seconds=vocal_seconds,
+                             on_progress=progress.tracker(60, 90, "🎵 Applying effects and exporting to MP3..."))
+    if error or not os.path.exists(output_song):
+        raise RuntimeError(f"MP3 export failed: {error.splitlines()[-1] if error else 'no output'}")
+    if os.path.exists(output_vocal):
+        os.remove(output_vocal)
+
+    duration = probe_duration(output_song) or 0
+    info = (f"🎵 **Song Generated**\n- Style: {song_style}\n- Tempo: {tempo} ({bpm} BPM)\n"
+            f"- Voice: {voice_name}\n- Duration: {duration:.1f}s")
+    return {"output": output_song, "info": info}
+
+
+PIPELINES = {
+    "beatmerge": run_beatmerge,
+    "hours_loop": run_hours_loop,
+    "song": run_song_generator,
+}
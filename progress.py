@@ -0,0 +1,181 @@
+"""
+Real progress reporting for the ffmpeg and MoviePy stages of a job.
+
+- run_ffmpeg() runs ffmpeg with "-progress pipe:1" and turns its key=value
+  stream into stats (position, encode fps, speed multiplier, bytes written, ETA).
+- MoviePyProgressLogger does the same for write_videofile() via proglog.
+- ProgressReporter is the `progress` object the pipelines receive: it forwards
+  percent/message/metrics to a callback and records a timing entry per stage.
+"""
+import time
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+from proglog import ProgressBarLogger
+
+# Don't report more often than this (seconds); each report may hit the job database
+REPORT_INTERVAL = 0.5
+# Lines of ffmpeg's stderr kept in a job's error message
+STDERR_TAIL_LINES = 8
+
+
+def _ffmpeg_stats(raw, total_seconds, started):
+    """Convert one block of ffmpeg -progress output into a stats dict."""
+    try:
+        position = int(raw.get("out_time_us") or raw.get("out_time_ms") or 0) / 1_000_000
+    except ValueError:  # "N/A" before the first packet is written
+        position = 0.0
+    try:
+        speed = float(raw.get("speed", "0").rstrip("x") or 0)
+    except ValueError:
+        speed = 0.0
+    try:
+        fps = float(raw.get("fps", 0))
+    except ValueError:
+        fps = 0.0
+    try:
+        bytes_written = int(raw.get("total_size", 0))
+    except ValueError:
+        bytes_written = 0
+
+    stats = {"position": round(position, 2), "fps": fps, "speed": speed, "bytes": bytes_written,
+             "elapsed": round(time.time() - started, 2), "fraction": None, "eta": None}
+    if total_seconds:
+        stats["fraction"] = min(1.0, position / total_seconds)
+        if speed > 0:
+            stats["eta"] = round(max(0.0, total_seconds - position) / speed, 1)
+    return stats
+
+
+def run_ffmpeg(cmd, on_progress=None, total_seconds=None):
+    """
+    Run an ffmpeg command (string for shell=True, or argument list) and report progress.
+    on_progress(stats) is called about every REPORT_INTERVAL seconds; if it raises (e.g. the
+    job was cancelled) ffmpeg is killed and the exception propagates.
+    Returns (returncode, stderr_text).
+    """
+    shell = isinstance(cmd, str)
+    if shell:
+        cmd = cmd.replace("ffmpeg ", "ffmpeg -progress pipe:1 -nostats ", 1)
+    else:
+        cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+
+    started = time.time()
+    last_report = 0.0
+    raw = {}
+    # stderr goes to a temp file so a chatty ffmpeg can't fill the pipe and block
+    with tempfile.TemporaryFile(mode="w+") as err:
+        proc = subprocess.Popen(cmd, shell=shell, stdout=subprocess.PIPE, stderr=err, text=True)
+        try:
+            for line in proc.stdout:
+                key, _, value = line.strip().partition("=")
+                raw[key] = value
+                if key != "progress":
+                    continue
+                now = time.time()
+                if on_progress and (value == "end" or now - last_report >= REPORT_INTERVAL):
+                    last_report = now
+                    on_progress(_ffmpeg_stats(raw, total_seconds, started))
+                raw = {}
+            proc.wait()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        err.seek(0)
+        return proc.returncode, err.read()
+
+
+def stderr_tail(stderr, lines=STDERR_TAIL_LINES):
+    """The last non-empty lines of ffmpeg's stderr, where the actual error is (banner and stats come first)."""
+    return "\n".join([line for line in (stderr or "").splitlines() if line.strip()][-lines:])
+
+
+class MoviePyProgressLogger(ProgressBarLogger):
+    """proglog logger for write_videofile() that reports frame progress, fps and ETA."""
+
+    def __init__(self, on_progress):
+        super().__init__()
+        self.on_progress = on_progress
+        self._started = None
+        self._last_report = 0.0
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if attr != "index" or bar not in ("frame_index", "t"):
+            return
+        now = time.time()
+        if self._started is None:
+            self._started = now
+        total = self.bars[bar].get("total") or 0
+        done = value >= total > 0
+        if not done and now - self._last_report < REPORT_INTERVAL:
+            return
+        self._last_report = now
+
+        elapsed = max(now - self._started, 1e-6)
+        fps = value / elapsed
+        fraction = min(1.0, value / total) if total else None
+        eta = round((total - value) / fps, 1) if total and fps > 0 else None
+        self.on_progress({"position": value, "fps": round(fps, 1), "speed": None, "bytes": None,
+                          "elapsed": round(elapsed, 2), "fraction": fraction, "eta": eta})
+
+
+def describe(stats):
+    """Short human readable summary: '42 fps · 3.1x · ETA 12s · 18.2 MB'."""
+    parts = []
+    if stats.get("fps"):
+        parts.append(f"{stats['fps']:.0f} fps")
+    if stats.get("speed"):
+        parts.append(f"{stats['speed']:.1f}x")
+    if stats.get("eta") is not None:
+        parts.append(f"ETA {stats['eta']:.0f}s")
+    if stats.get("bytes"):
+        parts.append(f"{stats['bytes'] / 1024 ** 2:.1f} MB")
+    return " · ".join(parts)
+
+
+class ProgressReporter:
+    """
+    Progress sink handed to the pipelines as `progress`:
+        progress(percent, message, **metrics)   - plain update
+        with progress.stage("render"): ...      - time a stage (recorded in .timings)
+        progress.tracker(20, 60, "Rendering")   - callback for run_ffmpeg / MoviePyProgressLogger
+    on_update(percent, message, metrics) receives every update.
+    """
+
+    def __init__(self, on_update=None):
+        self.on_update = on_update
+        self.timings = []
+        self._stage_metrics = None
+
+    def __call__(self, percent, message="", **metrics):
+        if self._stage_metrics is not None and metrics:
+            self._stage_metrics.update(metrics)
+        if self.on_update:
+            self.on_update(int(percent), message, metrics)
+
+    @contextmanager
+    def stage(self, name):
+        record = {"stage": name, "started": round(time.time(), 3)}
+        outer_metrics = self._stage_metrics
+        self._stage_metrics = {}
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - t0, 3)
+            # Last throughput numbers seen during the stage (fps, speed, bytes...)
+            record.update({k: v for k, v in self._stage_metrics.items()
+                           if k in ("fps", "speed", "bytes") and v})
+            self._stage_metrics = outer_metrics
+            self.timings.append(record)
+
+    def tracker(self, start_pct, end_pct, message):
+        """Map a stage's own 0..1 progress onto start_pct..end_pct of the job."""
+        def on_progress(stats):
+            fraction = stats.get("fraction") or 0
+            detail = describe(stats)
+            self(start_pct + (end_pct - start_pct) * fraction,
+                 f"{message} {detail}" if detail else message, **stats)
+        return on_progress
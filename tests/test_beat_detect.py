@@ -0,0 +1,54 @@
+import shutil
+import wave
+
+import numpy as np
+import pytest
+
+from beat_detect import onset_envelope, estimate_period, beat_cut_frames
+
+CLICK_RATE = 44100
+
+
+def write_click_track(path, bpm, seconds=60, offset=0.1):
+    """Mono 16-bit WAV with a 5 ms rectangular (broadband) click on every beat."""
+    click = np.ones(int(0.005 * CLICK_RATE))
+    audio = np.zeros(int(seconds * CLICK_RATE))
+    for start in np.arange(offset, seconds - 0.05, 60 / bpm):
+        idx = int(round(start * CLICK_RATE))
+        audio[idx:idx + len(click)] += click
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(CLICK_RATE)
+        f.writeframes((audio * 0.8 * 32767).astype("<i2").tobytes())
+    return path
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="needs ffmpeg")
+@pytest.mark.parametrize("bpm", [90, 100, 128, 140])
+def test_click_track_tempo(tmp_path, bpm):
+    env, frame_rate = onset_envelope(str(write_click_track(tmp_path / f"click_{bpm}.wav", bpm)))
+    period = estimate_period(env, frame_rate)
+    assert period is not None
+    assert 60 * frame_rate / period == pytest.approx(bpm, abs=0.5)
+
+
+def test_estimate_period_between_lags():
+    # 140 BPM at 43 frames/s is 18.43 frames per beat: the peak falls between two lags
+    frame_rate = 11025 / 256
+    env = np.zeros(int(60 * frame_rate))
+    env[np.rint(np.arange(0, len(env) - 1, 60 * frame_rate / 140)).astype(int)] = 1.0
+    period = estimate_period(env, frame_rate)
+    assert 60 * frame_rate / period == pytest.approx(140, abs=0.5)
+
+
+def test_estimate_period_too_short():
+    assert estimate_period(np.ones(10), 11025 / 256) is None
+
+
+def test_beat_cut_frames_whole_beats_without_drift():
+    period, fps = 60 / 140, 30
+    frames = beat_cut_frames([2.0, 3.1, 0.2, 5.0], period, fps)
+    beats = np.cumsum([4, 7, 1, 11])
+    # Every cut sits on a whole beat, rounded on the running total
+    assert np.cumsum(frames).tolist() == [round(b * period * fps) for b in beats]
@@ -0,0 +1,13 @@
+from ffmpeg_render import loop_friendly_gop
+
+
+def test_loop_friendly_gop_divides_total():
+    gop = loop_friendly_gop(1350, 60)
+    assert 1350 % gop == 0
+    assert gop == 54
+
+
+def test_loop_friendly_gop_fallback():
+    assert loop_friendly_gop(None, 60) == 60
+    # A prime frame count has no divisor near the target
+    assert loop_friendly_gop(1009, 60) == 60
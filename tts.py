@@ -0,0 +1,145 @@
+"""
+Lyrics -> vocal track, one cached fragment per lyric line.
+
+Lines are synthesized separately (edge-tts lines concurrently, bounded by a
+semaphore), stored in the "tts" DiskCache under (engine, text, voice, rate),
+and stitched with a stream-copy concat. Re-running with one line changed only
+synthesizes that line; repeated lines (a chorus) are synthesized once.
+"""
+import os
+import shutil
+import asyncio
+import functools
+import threading
+
+from media_cache import tts_cache, tts_key
+from ffmpeg_render import concat_segments
+
+# Try importing edge-tts for better quality singing
+try:
+    from edge_tts import Communicate
+    EDGE_TTS_AVAILABLE = True
+except ImportError:
+    EDGE_TTS_AVAILABLE = False
+
+TTS_CONCURRENCY = int(os.environ.get("BEATMERGE_TTS_CONCURRENCY", "4"))
+
+# One pyttsx3 engine per process, shared by the worker threads one job at a time
+_pyttsx3_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def pyttsx3_engine():
+    import pyttsx3
+    return pyttsx3.init()
+
+
+def split_lyrics(lyrics):
+    """Non-empty lyric lines, in order."""
+    return [line.strip() for line in lyrics.splitlines() if line.strip()]
+
+
+def _cached_fragments(engine, lines, voice, rate, suffix, work_dir, synthesize_missing, on_fragment=None):
+    """
+    Fragment paths for every line, synthesizing only the lines not in the cache.
+    synthesize_missing([(text, tmp_path), ...], on_done) must create every tmp_path.
+    """
+    cache = tts_cache()
+    keys = [tts_key(engine, text, voice, rate) for text in lines]
+    paths = {}
+    bytes_saved = 0
+    for key in set(keys):
+        cached = cache.get(key, suffix)
+        if cached:
+            paths[key] = cached
+            bytes_saved += os.path.getsize(cached)
+    hits = len(paths)
+
+    # Each distinct missing line once, even if it repeats in the lyrics
+    fragment_dir = os.path.join(work_dir, "tts_fragments")
+    os.makedirs(fragment_dir, exist_ok=True)
+    todo = {}
+    for key, text in zip(keys, lines):
+        if key not in paths and key not in todo:
+            todo[key] = (text, os.path.join(fragment_dir, key + suffix))
+
+    done = hits
+
+    def on_done():
+        nonlocal done
+        done += 1
+        if on_fragment:
+            on_fragment(done, hits + len(todo))
+
+    if on_fragment and hits:
+        on_fragment(done, hits + len(todo))
+    if todo:
+        synthesize_missing(list(todo.values()), on_done)
+    for key, (text, tmp_path) in todo.items():
+        if not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+            raise RuntimeError(f"TTS produced no audio for line: {text!r}")
+        paths[key] = cache.put(key, tmp_path, suffix, protect=paths.values())
+    shutil.rmtree(fragment_dir, ignore_errors=True)
+
+    cache.record(hits=hits, misses=len(todo), bytes_saved=bytes_saved)
+    return [paths[key] for key in keys], hits
+
+
+def _edge_synthesize(voice, rate):
+    def synthesize_missing(jobs, on_done):
+        async def save(text, dst, semaphore):
+            async with semaphore:
+                await Communicate(text=text, voice=voice, rate=rate).save(dst)
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(TTS_CONCURRENCY)
+            for task in asyncio.as_completed([save(text, dst, semaphore) for text, dst in jobs]):
+                await task
+                on_done()
+
+        # Worker threads have no running event loop of their own
+        asyncio.run(run_all())
+    return synthesize_missing
+
+
+def _pyttsx3_synthesize(engine):
+    def synthesize_missing(jobs, on_done):
+        # pyttsx3 isn't thread safe: queue every line on the one engine, then run it once
+        for text, dst in jobs:
+            engine.save_to_file(text, dst)
+        engine.runAndWait()
+        for _ in jobs:
+            on_done()
+    return synthesize_missing
+
+
+def synthesize_lyrics(lyrics, voice, rate, output_base, work_dir, pyttsx3_rate=150, on_fragment=None):
+    """
+    Vocal track for the lyrics. Uses edge-tts (voice, rate like "+20%") when available,
+    otherwise the shared pyttsx3 engine at pyttsx3_rate words per minute.
+    Returns (vocal_path, cached_line_count).
+    """
+    lines = split_lyrics(lyrics)
+    if not lines:
+        raise RuntimeError("Lyrics are empty.")
+
+    if EDGE_TTS_AVAILABLE:
+        fragments, hits = _cached_fragments("edge-tts", lines, voice, rate, ".mp3", work_dir,
+                                            _edge_synthesize(voice, rate), on_fragment)
+        output_vocal = f"{output_base}_vocal.mp3"
+    else:
+        with _pyttsx3_lock:
+            engine = pyttsx3_engine()
+            voices = engine.getProperty('voices')
+            engine.setProperty('voice', voices[0].id)
+            engine.setProperty('rate', pyttsx3_rate)
+            engine.setProperty('volume', 0.9)
+            fragments, hits = _cached_fragments("pyttsx3", lines, voices[0].id, pyttsx3_rate, ".wav", work_dir,
+                                                _pyttsx3_synthesize(engine), on_fragment)
+        output_vocal = f"{output_base}_vocal.wav"
+
+    # Same codec and parameters in every fragment, so they join with stream copy
+    error = concat_segments(fragments, output_vocal, f"{output_base}_fragments.txt")
+    if error:
+        raise RuntimeError(f"Failed to join the vocal fragments: {error}")
+    return output_vocal, hits